@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+    bench.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Offline benchmarks for the Anti-Banner utils. Starts the local stand-in
+    server from standin.py, points the utils at it through a temporary
+    credentials.json and DATA_DIR, and measures end-to-end latency and
+    throughput of grades.main, banner_changes.main and multi-account polling,
+    and how fast the CAS login form is read from login pages (the stand-in's
+    and any recorded login*.html pages in --fixtures).
+
+    Example: `./bench.py --runs 20 --accounts 50 --latency 20`
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from standin import LOGIN_PAGE, StandIn
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+def percentile(samples, p):
+    """
+    Gets the p-th percentile of a list of samples (nearest rank).
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 *
+        (len(ordered) - 1))))]
+
+def report(name, samples, wall, results):
+    """
+    Prints and collects the latency summary for one benchmark.
+
+    Args:
+        name (string):      The benchmark name.
+        samples (list):     Seconds taken by each operation.
+        wall (float):       Seconds taken by the whole benchmark.
+        results (list):     Where to append the summary.
+    """
+    result = {
+            'name' : name,
+            'ops' : len(samples),
+            'p50_ms' : percentile(samples, 50) * 1000,
+            'p95_ms' : percentile(samples, 95) * 1000,
+            'max_ms' : max(samples) * 1000,
+            'ops_per_s' : len(samples) / wall,
+            }
+    print('{name:<28} {ops:>6} ops  p50 {p50_ms:8.1f} ms  p95 {p95_ms:8.1f} '
+            'ms  max {max_ms:8.1f} ms  {ops_per_s:8.1f} ops/s'.format(**result))
+    results.append(result)
+
+def timed(func, runs):
+    """
+    Runs func() runs times with its output suppressed.
+
+    Returns:
+        A tuple of the per-run seconds and the total seconds.
+    """
+    samples = []
+    start = time.time()
+    for i in range(runs):
+        before = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        samples.append(time.time() - before)
+    return (samples, time.time() - start)
+
+def bench_grades(opts, results):
+    import grades
+    report('grades.main', *timed(grades.main, opts.runs), results=results)
+
+def bench_changes(opts, results):
+    import banner_changes
+    report('banner_changes.main', *timed(banner_changes.main, opts.runs),
+            results=results)
+
+def bench_accounts(opts, results):
+    import banner_connect
+    logins = [('bench{:04d}'.format(i), 'password')
+            for i in range(opts.accounts)]
+    samples = []
+    lock = threading.Lock()
+
+    def poll(chunk):
+        for login in chunk:
+            before = time.time()
+            banner_connect.get_schedule('Spring', '2017', login=login)
+            with lock:
+                samples.append(time.time() - before)
+
+    threads = [threading.Thread(target=poll, args=(logins[i::opts.threads],))
+            for i in range(opts.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report('multi-account (threads)', samples, time.time() - start, results)
+
+def bench_accounts_async(opts, results):
+    try:
+        import banner_async
+        import asyncio
+        banner_async.Client()
+    except ImportError as e:
+        print('multi-account (asyncio)      skipped: {}'.format(e))
+        return
+
+    logins = [('async{:04d}'.format(i), 'password')
+            for i in range(opts.accounts)]
+    samples = []
+
+    async def poll(client, login):
+        before = time.time()
+        await client.get_schedule('Spring', '2017', login=login)
+        samples.append(time.time() - before)
+
+    async def run():
+        async with banner_async.Client() as client:
+            await asyncio.gather(*[poll(client, login) for login in logins])
+
+    start = time.time()
+    asyncio.get_event_loop().run_until_complete(run())
+    report('multi-account (asyncio)', samples, time.time() - start, results)
+
+def login_pages(fixtures=None):
+    """
+    Gets the login pages to read the form of, the stand-in's one padded out
+    like a real CAS page and any recorded ones.
+
+    Returns:
+        A list of (name, page text) tuples.
+    """
+    page = LOGIN_PAGE.format(service='https%3A%2F%2Fregistrationssb.ucr.edu',
+            lt='bench')
+    pages = [('stand-in', page.replace('</body>', '<script>{}</script>'
+        '</body>'.format('var x = 1;\n' * 2000)))]
+    for path in sorted(glob.glob(os.path.join(fixtures or '', 'login*.html'))
+            if fixtures else []):
+        with open(path) as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+def bench_login(opts, results):
+    import banner_connect
+    for name, page in login_pages(opts.fixtures):
+        chunks = [page[i:i + 4096] for i in range(0, len(page), 4096)]
+        report('login form ({})'.format(name)[:28], *timed(lambda:
+            banner_connect.login_form(chunks, ('bench', 'password')),
+            opts.runs * 100), results=results)
+
+BENCHMARKS = {
+        'grades' : bench_grades,
+        'changes' : bench_changes,
+        'accounts' : bench_accounts,
+        'async' : bench_accounts_async,
+        'login' : bench_login,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline Anti-Banner ' +
+            'benchmarks against a local stand-in server')
+    parser.add_argument('benchmarks', nargs='*', default=sorted(BENCHMARKS),
+            help='any of {}'.format(', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--runs', type=int, default=10,
+            help='runs of each single-account benchmark')
+    parser.add_argument('--accounts', type=int, default=20,
+            help='accounts in the multi-account benchmarks')
+    parser.add_argument('--threads', type=int, default=8,
+            help='threads in the threaded multi-account benchmark')
+    parser.add_argument('--latency', type=float, default=0,
+            help='milliseconds the stand-in adds to every response')
+    parser.add_argument('--failure-rate', type=float, default=0,
+            help='fraction of stand-in responses that are a 503')
+    parser.add_argument('--error-rate', type=float, default=0,
+            help='fraction of Banner responses that are an HTML error page')
+    parser.add_argument('--courses', type=int, default=6,
+            help='registrations per account')
+    parser.add_argument('--fixtures', help='directory of recorded responses')
+    parser.add_argument('--rate-limit', action='store_true',
+            help='keep the default rate limits instead of disabling them')
+    parser.add_argument('--json', metavar='file',
+            help='also write the results to a JSON file')
+    opts = parser.parse_args()
+
+    standin = StandIn(latency=opts.latency / 1000.0,
+            failure_rate=opts.failure_rate, error_rate=opts.error_rate,
+            courses=opts.courses, fixtures=opts.fixtures).start()
+    host = standin.url.split('//')[1]
+
+    tmp = tempfile.mkdtemp(prefix='anti-banner-bench-')
+    config = {
+            'netID' : 'bench',
+            'password' : 'password',
+            'sid' : '860000000',
+            'pushbullet' : '',
+            'base_urls' : standin.base_urls(),
+            }
+    if not opts.rate_limit:
+        config['rate_limits'] = { host : { 'rate' : 1e9, 'burst' : 1e9 } }
+    credentials = os.path.join(tmp, 'credentials.json')
+    with open(credentials, 'w') as f:
+        json.dump(config, f)
+
+    # anti_banner parses sys.argv on import, so hand it what the utils need
+    sys.argv = [sys.argv[0], '-q', 'spring', '-y', '2017', '-c', credentials,
+            '--silent']
+    sys.path.insert(0, SRC_DIR)
+    import anti_banner as app
+    app.DATA_DIR = os.path.join(tmp, '.data')
+    app.LOG_DIR = os.path.join(tmp, '.logs')
+    os.makedirs(app.DATA_DIR)
+    os.makedirs(app.LOG_DIR)
+
+    print('Stand-in at {}, data in {}\n'.format(standin.url, tmp))
+    results = []
+    for name in opts.benchmarks:
+        BENCHMARKS[name](opts, results)
+    print('\n{} requests, {} logins served'.format(standin.requests,
+        standin.logins))
+    standin.stop()
+
+    if opts.json:
+        with open(opts.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
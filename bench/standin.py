@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+    standin.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    A local stand-in for the UCR CAS, Banner and RWeb servers, so the
+    Anti-Banner utils can be run and benchmarked without touching the live
+    servers. Every service is served from one host; point the utils at it
+    with a "base_urls" entry in credentials.json.
+
+    Serves:
+        /cas/login                                  CAS login form and POST
+        /StudentRegistrationSsb/ssb/registrationHistory/reset
+        /StudentSelfService/ssb/studentProfile[/viewGPAHoursList]
+        /ssomanager/c/SSB
+        /banprod/bwskogrd.P_ViewGrde
+
+    Responses are generated, or loaded from a fixtures directory containing
+    any of registrationHistory.json, grades.html and gpa.json.
+
+    Example: `./standin.py --port 8080 --latency 50 --failure-rate 0.05`
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, quote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import quote
+
+PROTECTED = (
+        '/StudentRegistrationSsb/',
+        '/StudentSelfService/',
+        '/ssomanager/',
+        '/banprod/',
+        )
+
+SUBJECTS = ['CS', 'EE', 'MATH', 'PHYS', 'ENGL', 'HIST', 'CHEM', 'BIOL']
+GRADES = ['A+', 'A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', '']
+
+def registrations(courses=6, seed=0):
+    """
+    Generates a registrationHistory response shaped like Banner's.
+
+    Args:
+        courses (int):  The number of registrations to generate.
+        seed (int):     Seed for the generated values.
+
+    Returns:
+        The response as a dict.
+    """
+    rand = random.Random(seed)
+    regs = []
+    for i in range(courses):
+        days = rand.choice([('monday', 'wednesday', 'friday'),
+            ('tuesday', 'thursday'), ('monday', 'wednesday'), ()])
+        begin = rand.choice(['0810', '0940', '1110', '1240', '1410', ''])
+        end = '{:02d}{}'.format(int(begin[:2]) + 1, begin[2:]) if begin else ''
+        regs.append({
+            'termDescription' : 'Spring 2017',
+            'courseReferenceNumber' : str(10000 + i),
+            'subject' : rand.choice(SUBJECTS),
+            'subjectDescription' : 'Subject {}'.format(i),
+            'courseNumber' : str(rand.randint(1, 199)),
+            'sequenceNumber' : '{:03d}'.format(rand.randint(1, 30)),
+            'courseTitle' : 'COURSE TITLE {}'.format(i),
+            'scheduleDescription' : 'Lecture',
+            'instructionalMethodDescription' : 'In Person' if begin else \
+                    'Online',
+            'grade' : rand.choice(GRADES),
+            'creditHours' : 4,
+            'faculty' : [{
+                'displayName' : 'Instructor {}'.format(i),
+                'emailAddress' : 'instructor{}@ucr.edu'.format(i),
+                'primaryIndicator' : True,
+                }],
+            'meetingTimes' : [dict({
+                'startDate' : '04/03/2017',
+                'endDate' : '06/09/2017',
+                'beginTime' : begin,
+                'endTime' : end,
+                'building' : 'WCH',
+                'buildingDescription' : 'Winston Chung Hall',
+                'room' : str(rand.randint(100, 299)),
+                'saturday' : False,
+                'sunday' : False,
+                }, **dict((d, d in days) for d in ('monday', 'tuesday',
+                    'wednesday', 'thursday', 'friday')))],
+            'attributes' : [{'description' : 'attribute'}] * 3,
+            })
+    return { 'success' : True, 'data' : { 'registrations' : regs } }
+
+def grades_page(courses):
+    """
+    Renders an RWeb final grades page with the grade table as its 6th table.
+
+    Args:
+        courses (list): Registrations as generated by registrations().
+
+    Returns:
+        The page as a string.
+    """
+    rows = ''.join('<tr><td>\n{}</td><td>\n{}</td><td>\n{}</td>'
+            '<td>\n{}</td><td>\n{}</td><td>R</td><td>\n{}</td></tr>'.format(
+                c['courseReferenceNumber'], c['subject'], c['courseNumber'],
+                c['sequenceNumber'], c['courseTitle'], c['grade'] or 'NR')
+            for c in courses)
+    return '<html><body>' + '<table><tr><td>layout</td></tr></table>' * 5 + \
+            '<table><tr><th>Final Grades</th></tr>' + \
+            '<tr><th>CRN</th><th>Subject</th><th>Course</th><th>Section' + \
+            '</th><th>Title</th><th>Campus</th><th>Grade</th></tr>' + rows + \
+            '</table></body></html>'
+
+LOGIN_PAGE = '''<html><body>
+<form id="fm1" class="fm-v clearfix" action="/cas/login?service={service}"
+ method="post">
+<input id="username" name="username" type="text" value="" />
+<input id="password" name="password" type="password" value="" />
+<input type="hidden" name="lt" value="LT-{lt}" />
+<input type="hidden" name="execution" value="e1s1" />
+<input type="hidden" name="_eventId" value="submit" />
+<input class="btn-submit" name="submit" value="LOGIN" type="image" />
+</form>
+</body></html>'''
+
+class StandIn(object):
+    """
+    The stand-in server, running in a background thread.
+
+    Args:
+        port (int):             Port to listen on, 0 picks a free one.
+        latency (float):        Seconds added to every response.
+        failure_rate (float):   Fraction of responses that are a 503.
+        error_rate (float):     Fraction of Banner responses that are an HTML
+                                error page with a 200 status.
+        courses (int):          Registrations to generate.
+        fixtures (string):      Optional directory of recorded responses.
+    """
+
+    def __init__(self, port=0, latency=0, failure_rate=0, error_rate=0,
+            courses=6, fixtures=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.requests = 0
+        self.logins = 0
+        self.granting = set()
+        self.tickets = set()
+        self.sessions = set()
+        self._lock = threading.Lock()
+
+        reg = registrations(courses)
+        self.responses = {
+                'registrationHistory.json' : json.dumps(reg),
+                'grades.html' : grades_page(reg['data']['registrations']),
+                'gpa.json' : json.dumps({ 'overallGpa' : '3.51' }),
+                }
+        for name in self.responses:
+            path = os.path.join(fixtures or '', name)
+            if fixtures and os.path.exists(path):
+                with open(path) as fixture:
+                    self.responses[name] = fixture.read()
+
+        standin = self
+        class Handler(_Handler):
+            server_state = standin
+        self.server = _Server(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = None
+
+    def base_urls(self):
+        """
+        Gets the "base_urls" config that points every service here.
+        """
+        return dict((name, self.url) for name in ('auth', 'registration',
+            'profile', 'sso', 'rweb'))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+class _Handler(BaseHTTPRequestHandler):
+    server_state = None
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out as separate writes
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        state = self.server_state
+        self.new_cookie = None
+        with state._lock:
+            state.requests += 1
+        if state.latency:
+            time.sleep(state.latency)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if random.random() < state.failure_rate:
+            return self.reply(503, 'Service Unavailable', 'text/plain')
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/cas/login'):
+            return self.cas(query, parse_qs(body))
+
+        if not url.path.startswith(PROTECTED):
+            return self.reply(404, 'Not Found', 'text/plain')
+        if not self.authenticated(query):
+            service = 'http://{}{}'.format(self.headers['Host'], self.path)
+            return self.redirect('/cas/login?service=' + quote(service, ''))
+
+        if url.path.endswith('/registrationHistory/reset'):
+            if random.random() < state.error_rate:
+                return self.reply(200, '<html><body>Banner is having ' +
+                        'trouble</body></html>', 'text/html')
+            return self.reply(200, state.responses['registrationHistory.json'],
+                    'application/json')
+        if url.path.endswith('/viewGPAHoursList'):
+            return self.reply(200, state.responses['gpa.json'],
+                    'application/json')
+        if url.path.endswith('bwskogrd.P_ViewGrde'):
+            return self.reply(200, state.responses['grades.html'], 'text/html')
+        return self.reply(200, '<html><body>Welcome</body></html>',
+                'text/html')
+
+    def cas(self, query, form):
+        state = self.server_state
+        service = query.get('service', [''])[0]
+        logged_in = self.cookie('CASTGC') in state.granting
+        if self.command == 'POST':
+            logged_in = form.get('username') and form.get('lt') and \
+                    form.get('password', [''])[0] != 'wrong'
+            if logged_in:
+                with state._lock:
+                    state.logins += 1
+                    self.new_cookie = 'CASTGC', 'TGT-' + uuid.uuid4().hex
+                    state.granting.add(self.new_cookie[1])
+
+        if not logged_in:
+            return self.reply(200, LOGIN_PAGE.format(
+                service=quote(service, ''), lt=uuid.uuid4().hex), 'text/html')
+        if not service:
+            return self.reply(200, '<html><body>Logged in</body></html>',
+                    'text/html')
+        ticket = 'ST-' + uuid.uuid4().hex
+        with state._lock:
+            state.tickets.add(ticket)
+        return self.redirect(service + ('&' if '?' in service else '?') +
+                'ticket=' + ticket)
+
+    def authenticated(self, query):
+        state = self.server_state
+        if self.cookie('JSESSIONID') in state.sessions:
+            return True
+        ticket = query.get('ticket', [None])[0]
+        with state._lock:
+            if ticket in state.tickets:
+                state.tickets.discard(ticket)
+                self.new_cookie = 'JSESSIONID', uuid.uuid4().hex
+                state.sessions.add(self.new_cookie[1])
+                return True
+        return False
+
+    def cookie(self, name):
+        for part in (self.headers.get('Cookie') or '').split(';'):
+            if part.strip().startswith(name + '='):
+                return part.strip()[len(name) + 1:]
+        return None
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_cookie()
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_cookie(self):
+        if self.new_cookie:
+            self.send_header('Set-Cookie', '{}={}; Path=/'.format(
+                *self.new_cookie))
+
+    def reply(self, status, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cookie()
+        self.end_headers()
+        self.wfile.write(body)
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the ' +
+            'UCR CAS, Banner and RWeb servers')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0,
+            help='milliseconds added to every response')
+    parser.add_argument('--failure-rate', type=float, default=0,
+            help='fraction of responses that are a 503')
+    parser.add_argument('--error-rate', type=float, default=0,
+            help='fraction of Banner responses that are an HTML error page')
+    parser.add_argument('--courses', type=int, default=6,
+            help='number of registrations to generate')
+    parser.add_argument('--fixtures', help='directory of recorded responses')
+    opts = parser.parse_args()
+
+    standin = StandIn(opts.port, opts.latency / 1000.0, opts.failure_rate,
+            opts.error_rate, opts.courses, opts.fixtures)
+    print('Serving on {}, add this to credentials.json:'.format(standin.url))
+    print(json.dumps({ 'base_urls' : standin.base_urls() }, indent=4))
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nBye Felicia!')
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,12 @@
 """
 import anti_banner as app
 import gcal
+import json
+import os
 import time
-from datetime import datetime
 from datetime import timedelta
 from banner_connect import get_schedule
+from model import load_courses
 
 app_name = 'Class Schedule'
 version = '1.0'
@@ -21,86 +23,49 @@ UCR = 'University of California, Riverside'
 timeZone = 'America/Los_Angeles'
 utcOffset = str(time.localtime().tm_gmtoff/60/60)
 tzOffset = '-0' + utcOffset[1] + ':00'
+calendar_file = 'calendars.json'
+# course fields that show up on its calendar event
+EVENT_FIELDS = ('title', 'subject', 'number', 'section', 'schedule', 
+        'meetings', 'instructor', 'instructor_email')
 
-def get_days(meetingTimes):
+def get_days(times):
     """
     Creates a string for the days of the week the course is on.
 
     Args:
-        meetingTimes (dict):    The meetingTimes key from the JSON output of 
-                                get_schedule()
+        times (MeetingTime):    The meeting time of a course.
 
     Returns:
         A string consisting of the days of the week the course is scheduled 
         on.
     """
 
-    day_strings = ''
-
-    if meetingTimes['monday']:
-        day_strings = day_strings + 'MO,'
-    if meetingTimes['tuesday']:
-        day_strings = day_strings + 'TU,'
-    if meetingTimes['wednesday']:
-        day_strings = day_strings + 'WE,'
-    if meetingTimes['thursday']:
-        day_strings = day_strings + 'TH,'
-    if meetingTimes['friday']:
-        day_strings = day_strings + 'FR,'
-    if meetingTimes['saturday']:
-        day_strings = day_strings + 'SA,'
-
-    return day_strings[:-1]
-
-def get_instructor(faculty):
-    """
-    Gets the instructor info for the given course.
-
-    Args:
-        faculty (dict): The faculty key from the JSON output of get_schedule()
-
-    Returns:
-        A tuple with the instructor name and email address.
-    """
-
-    if len(faculty) >= 1:
-
-        # Iterate through all faculty entries (sometimes there are multiple)
-        for i in faculty:
-
-            # Return the primary instructor for the course
-            if i['primaryIndicator']:
-                if i['emailAddress']:
-                    return (i['displayName'], i['emailAddress'])
-                else:
-                    return (i['displayName'], 'Unavailable')
-
-    return ('Unavailable','Unavailable')
+    return ','.join(times.day_codes())
 
 def print_course_info(course):
     """
     Prints all of the relevant info for a course.
 
     Args:
-        course (dict):  A dict of all the course info returned from a single 
-                        entry of the JSON output of get_schedule()
+        course (Course):    The course to print.
     """
 
     # TODO: handle multiple meeting times
-    times = course['meetingTimes'][0]
-
-    print('CRN: {}'.format(course['courseReferenceNumber']))
-    print('Subject: {}'.format(course['subjectDescription']))
-    print('Course: {} {}'.format(course['subject'], course['courseNumber']))
-    print('Course Description: {}'.format(course['courseTitle']))
-    print('Course start: {}'.format(times['startDate']))
-    print('Course end: {}'.format(times['endDate']))
-    print('Instructor: {}'.format(get_instructor(course['faculty'])[0]))
-    print('Instructor email: {}'.format(get_instructor(course['faculty'])[1]))
-    print('Course Category: {}'.format(course['scheduleDescription']))
-    print('Start time: {}'.format(times['beginTime']))
-    print('End time: {}'.format(times['endTime']))
-    print('Room: {}, {} {}'.format(times['buildingDescription'], times['building'], times['room']))
+    times = course.meeting
+
+    print('CRN: {}'.format(course.crn))
+    print('Subject: {}'.format(course.subject_description))
+    print('Course: {} {}'.format(course.subject, course.number))
+    print('Course Description: {}'.format(course.title))
+    print('Course start: {}'.format(times.start_date))
+    print('Course end: {}'.format(times.end_date))
+    print('Instructor: {}'.format(course.instructor))
+    print('Instructor email: {}'.format(course.instructor_email))
+    print('Course Category: {}'.format(course.schedule))
+    print('Start time: {}'.format(times.begin_time))
+    print('End time: {}'.format(times.end_time))
+    print('Room: {}, {} {}'.format(times.building_description, times.building, 
+        times.room))
     print('Days: {}\n'.format(get_days(times)))
 
 def decrement_day(startDate):
@@ -108,27 +73,13 @@ def decrement_day(startDate):
     Returns a day previous to a relative date.
 
     Args:
-        startDate (string): the reference date (YYYY-MM-DD)
-
-    Returns:
-        A new date, exactly one day behind the original date.
-    """
-
-    new_date = datetime.strptime(startDate, '%Y-%m-%d') - timedelta(days=1)
-    return new_date.strftime('%Y-%m-%d')
+        startDate (date): the reference date
 
-def format_date(unformatted):
-    """
-    Creates an international-date formatted date string from a course start 
-    date.
-
-    Args:
-        unformatted (string): The unformatted date (MM/DD/YYYY)
     Returns:
-        The same date formatted in ISO format YYYY-MM-DD
+        A new date (YYYY-MM-DD), exactly one day behind the original date.
     """
 
-    return datetime.strptime(unformatted, '%m/%d/%Y').strftime('%Y-%m-%d')
+    return (startDate - timedelta(days=1)).strftime('%Y-%m-%d')
 
 def format_time(unformatted):
     """
@@ -152,28 +103,31 @@ def course_to_event(course):
     calendar.
 
     Args:
-        course (dict): The course object to create an event from.
+        course (Course): The course to create an event from.
     Returns:
         A calendar event representation of the course.
     """
 
     # TODO: handle multiple meeting times
-    times = course['meetingTimes'][0]
+    times = course.meeting
 
-    dayBehind = decrement_day(format_date(times['startDate']))
-    hardEnd = format_date(times['endDate']).replace('-', '') + 'T000000Z'
-    endTime = dayBehind + 'T' + format_time(times['endTime'])
-    startTime = dayBehind + 'T' + format_time(times['beginTime'])
+    dayBehind = decrement_day(times.start_date)
+    hardEnd = times.end_date.strftime('%Y%m%d') + 'T000000Z'
+    endTime = dayBehind + 'T' + format_time(times.end_time)
+    startTime = dayBehind + 'T' + format_time(times.begin_time)
+    # keeps the (dummy) first instance off the calendar, also once patched
+    exDate = dayBehind.replace('-', '') + 'T' + \
+            (times.begin_time or '0000') + '00'
 
-    location = '{} ({}) {}, {}'.format(times['buildingDescription'], 
-            times['building'], times['room'], UCR)
+    location = '{} ({}) {}, {}'.format(times.building_description, 
+            times.building, times.room, UCR)
 
-    course_info = course['subject'] + '-' + course['courseNumber'] + '-' + \
-            course['sequenceNumber'] + ' - ' + course['courseTitle'].title()
+    course_info = course.subject + '-' + course.number + '-' + \
+            course.section + ' - ' + course.title.title()
 
-    other_info = 'Instructor: ' + get_instructor(course['faculty'])[0] + '\n' + \
-            'Instructor email: ' + get_instructor(course['faculty'])[1] + \
-            '\n' + course['scheduleDescription']
+    other_info = 'Instructor: ' + course.instructor + '\n' + \
+            'Instructor email: ' + course.instructor_email + \
+            '\n' + course.schedule
 
     event = {
             'summary' : course_info,
@@ -189,8 +143,12 @@ def course_to_event(course):
                 },
             'recurrence' : [
                 'RRULE:FREQ=WEEKLY;UNTIL=' + hardEnd + ';BYDAY=' + \
-                        get_days(times)
+                        get_days(times),
+                'EXDATE;TZID=' + timeZone + ':' + exDate
                 ],
+            'extendedProperties' : {
+                'private' : { 'crn' : course.crn },
+                },
             # 'attendees' : [
             #     ],
             # 'reminders' : {
@@ -202,12 +160,90 @@ def course_to_event(course):
             }
     return event
 
-def import_to_gcal(calendar, events):
+def load_calendars():
+    """
+    Gets the calendars imported so far, by cache key, with the event id of 
+    each course by CRN.
+    """
+    try:
+        with open(os.path.join(app.DATA_DIR, calendar_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def save_calendar(key, calendar, events):
+    """
+    Records the calendar and event ids of a term, so changes can be synced 
+    to them later.
+
+    Args:
+        key (string):       The cache key of the term.
+        calendar (string):  The calendar id.
+        events (dict):      The event id of each course, by CRN.
+    """
+    with app.file_lock('calendars'):
+        calendars = load_calendars()
+        calendars[key] = { 'calendar' : calendar, 'events' : events }
+        # replaced whole, a torn file would forget every event id
+        path = os.path.join(app.DATA_DIR, calendar_file)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(calendars, f)
+        os.replace(path + '.tmp', path)
+
+def on_calendar(course):
+    return bool(course and course.meeting and course.meeting.begin_time)
+
+def resync(key, changes, courses):
+    """
+    Brings the calendar imported for a term up to date with changes to its 
+    courses, with one API call per changed course: its event is patched, 
+    added or deleted. Nothing is done if the term was never imported.
+
+    Args:
+        key (string):   The cache key of the term.
+        changes (list): The changes, see model.diff_courses().
+        courses (list): The courses of the term after the changes.
+
+    Returns:
+        The number of events that were patched, added or deleted.
+    """
+    imported = load_calendars().get(key)
+    if not imported:
+        return 0
+    calendar, events = imported['calendar'], dict(imported['events'])
+    courses = dict((course.crn, course) for course in courses)
+    changed = sorted(set(change['crn'] for change in changes 
+        if change['field'] is None or change['field'] in EVENT_FIELDS))
+
+    synced = 0
+    for crn in changed:
+        course = courses.get(crn)
+        if crn in events and on_calendar(course):
+            gcal.patch_calendar_event(calendar=calendar, event=events[crn], 
+                    body=course_to_event(course))
+        elif crn in events:
+            # dropped, or no longer has a meeting time
+            gcal.delete_calendar_event(calendar=calendar, 
+                    event=events.pop(crn))
+        elif on_calendar(course):
+            events[crn] = gcal.create_calendar_event(calendar=calendar, 
+                    event=course_to_event(course))['id']
+        else:
+            continue
+        synced += 1
+
+    if events != imported['events']:
+        save_calendar(key, calendar, events)
+    return synced
+
+def import_to_gcal(calendar, events, key=None):
     """
     Imports a courses object into Google Calendar using gcal.py
 
     Args:
         events (obj): the events to import.
+        key (string): the cache key of the term, to record the event ids 
+            under for resync()
     """
 
     calendar_list = gcal.get_calendar_list()
@@ -230,24 +266,29 @@ def import_to_gcal(calendar, events):
     cal = gcal.create_calendar(calendar=calendar, 
             calendarList=calendar_list)
     print('Calendar created, id: {}'.format(cal['id']))
+    event_ids = {}
 
     for course in events:
-        if course['meetingTimes'][0]['beginTime']:
+        if course.meeting and course.meeting.begin_time:
             # Course has a valid start time
             class_event = course_to_event(course)
             print('Adding {} to {} calendar'.format(class_event['summary'], 
                 calendar))
             event = gcal.create_calendar_event(calendar=cal['id'],event=class_event)
+            event_ids[course.crn] = event['id']
 
             # Delete first (dummy) instance of course
             clean_up_events(calendar=cal['id'], event=event['id'], 
                     capDate=class_event['start']['dateTime'])
-        elif course['instructionalMethodDescription'].lower() == 'online':
+        elif course.method.lower() == 'online':
             # Check if course is online
             class_event = course_to_event(course)
             print('CAUTION! {} is ONLINE, skipping calendar'.format(
                 class_event['summary']))
 
+    if key:
+        save_calendar(key, cal['id'], event_ids)
+
 def clean_up_events(calendar, event, capDate):
     """
     Deletes the first instance of an event on calendar for a date. This is 
@@ -287,8 +328,7 @@ def main():
         else:
             get_schedule(quarter, year)
 
-        cached_data = app.json.loads(app.get_cached(term)['data'])
-        courses = cached_data['data']['registrations']
+        courses = load_courses(app.get_cached(term)['data'])
 
         # Check that we have received something worthwhile
         if len(courses) > 0:
@@ -301,10 +341,13 @@ def main():
             # for course in courses:
             #     print_course_info(course) # print raw course info (debug)
 
-            import_to_gcal(calendar=class_schedule, events=courses)
+            import_to_gcal(calendar=class_schedule, events=courses, key=term)
             print('All Done!')
         else:
             print('Oops, that schedule is not available!')
+    except app.BannerError as e:
+        print(e)
+        exit(1)
     # Catch a ctrl+c interrupt and print an exit message
     except KeyboardInterrupt:
         print('\nBye Felicia!')
@@ -9,12 +9,27 @@
 """
 from datetime import datetime
 from getpass import getpass
+from contextlib import contextmanager
 # from subprocess import run
 import json
 import argparse
+import dbm
+import fcntl
+import hashlib
 import os
+import re
 import sys
 import shelve
+import time
+import zlib
+from lru import LRU
+# dbm.open() imports its backends lazily, which fails when threads open the 
+# cache for the first time at once, so import them up front
+for backend in ('dbm.gnu', 'dbm.ndbm'):
+    try:
+        __import__(backend)
+    except ImportError:
+        pass
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-q', nargs='?', metavar='academic quarter', 
@@ -30,6 +45,24 @@ parser.add_argument('--cached', action='store_true',
         help='use cached data, if available')
 parser.add_argument('--test', action='store_true', 
         help='test notifications')
+parser.add_argument('--force', action='store_true', 
+        help='poll even if the polling plan says not to')
+parser.add_argument('--record', nargs='?', const='cassette.json.gz', 
+        metavar='cassette', help='record all requests and responses')
+parser.add_argument('--replay', nargs='?', const='cassette.json.gz', 
+        metavar='cassette', help='replay recorded responses, no network')
+parser.add_argument('--port', type=int, metavar='port', 
+        help='port to listen on when serving')
+parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl', 
+        help='export format')
+parser.add_argument('--fields', metavar='field,field', 
+        help='fields to export, defaults to all of them')
+parser.add_argument('--since', metavar='watermark', 
+        help='export only terms changed after a watermark, or "last"')
+parser.add_argument('--trace', action='store_true', 
+        help='write timing spans to .logs/trace.jsonl')
+parser.add_argument('--profile', nargs='?', const='', metavar='cprofile dump', 
+        help='print timings per operation at exit, optionally dump cProfile')
 args = vars(parser.parse_args())
 
 data_file = 'reg.db'
@@ -49,8 +82,50 @@ DEBUG = args['debug']
 CACHED = args['cached']
 TEST = args['test']
 
+# tracing, metrics and logs need args and the directories from above
+import logs
+import metrics
+import tracing
+
+# how much of an unexpected response to keep in the error log
+ERROR_SNIPPET = 2000
+# characters of a response parsed at a time
+CHUNK = 64 * 1024
+# where the list of courses starts in registration JSON
+REGISTRATIONS = re.compile(r'"registrations"\s*:\s*(\[|null)')
+
+# version of the cache entry layout, entries without one are raw responses
+CACHE_SCHEMA = 2
+# the registration fields the utils read, everything else is dropped from 
+# the cache unless --debug is set
+COURSE_FIELDS = ('termDescription', 'courseReferenceNumber', 'subject', 
+        'subjectDescription', 'courseNumber', 'sequenceNumber', 
+        'courseTitle', 'scheduleDescription', 
+        'instructionalMethodDescription', 'grade', 'creditHours')
+MEETING_FIELDS = ('startDate', 'endDate', 'beginTime', 'endTime', 'building', 
+        'buildingDescription', 'room', 'monday', 'tuesday', 'wednesday', 
+        'thursday', 'friday', 'saturday', 'sunday')
+FACULTY_FIELDS = ('displayName', 'emailAddress', 'primaryIndicator')
+# cache entries kept in memory in front of reg.db, "memory_cache_entries" and 
+# "memory_cache_bytes" in credentials.json override these
+MEMORY_ENTRIES = 64
+MEMORY_BYTES = 8 * 1024 * 1024
+# entries read per opening of reg.db by iter_cached()
+CACHE_BATCH = 100
+
 TODAY = datetime.now()
 
+_credentials = None
+_config = None
+_memory = None
+_memory_version = None
+
+class BannerError(Exception):
+    """
+    Raised when Banner (or CAS) does not return usable data.
+    """
+    pass
+
 def print_greeting(module, version):
     """
     Prints a fancy greeting with the version number.
@@ -67,6 +142,10 @@ def get_login():
         A tuple with the user's netID and password.
     """
 
+    global _credentials
+    if _credentials:
+        return _credentials
+
     credentials = {}
 
     if args['c']:
@@ -93,7 +172,57 @@ def get_login():
         else:
             break
 
-    return (credentials['netID'], credentials['password'])
+    _credentials = (credentials['netID'], credentials['password'])
+    return _credentials
+
+def get_config(key, default=None):
+    """
+    Gets an optional setting from the credentials.json file.
+
+    Args:
+        key (string):   The setting to look up.
+        default:        What to return if the setting is not there.
+
+    Returns:
+        The value of the setting, or default.
+    """
+
+    global _config
+    if _config is None:
+        path = args['c'] or os.path.join(PROJ_ROOT, 'credentials.json')
+        try:
+            with open(path) as config:
+                _config = json.loads(config.read())
+        except:
+            _config = {}
+
+    return _config.get(key, default)
+
+def current_account():
+    """
+    Gets the netID of the account this process is working for.
+
+    Returns:
+        The netID as a string.
+    """
+
+    return get_login()[0]
+
+def get_accounts():
+    """
+    Gets every account configured in credentials.json. Extra accounts are 
+    listed under "accounts" as objects with a "netID" and "password".
+
+    Returns:
+        A list of (netID, password) tuples, with None standing for the 
+        default account from get_login().
+    """
+
+    accounts = [(account['netID'], account['password']) for account in 
+            get_config('accounts', [])]
+    if get_config('netID') or not accounts:
+        accounts.insert(0, None)
+    return accounts
 
 def get_user_input():
     """
@@ -210,70 +339,541 @@ def encode_quarter(quarter):
 
     return term
 
+def current_term(today=None):
+    """
+    Works out the academic quarter in session on a date. Quarters are 
+    counted as Winter from January, Spring from April, Summer from July and 
+    Fall from September.
+
+    Args:
+        today (datetime):   The date, defaults to TODAY.
+
+    Returns:
+        A tuple with the quarter and year as Strings, i.e. ('Spring', '2017').
+    """
+
+    today = today or TODAY
+    if today.month < 4:
+        quarter = 'Winter'
+    elif today.month < 7:
+        quarter = 'Spring'
+    elif today.month < 9:
+        quarter = 'Summer'
+    else:
+        quarter = 'Fall'
+    return (quarter, str(today.year))
+
+def next_term(quarter, year):
+    """
+    Gets the quarter that follows another, in Banner term code order.
+
+    Args:
+        quarter (string):   The academic quarter.
+        year (string):      The academic year.
+
+    Returns:
+        A tuple with the next quarter and year as Strings.
+    """
+
+    term = encode_quarter(quarter)
+    if term == '40':
+        return ('Winter', str(int(year) + 1))
+    following = str(int(term) + 10)
+    quarter = [q for q in ('Winter', 'Spring', 'Summer', 'Fall') 
+            if encode_quarter(q) == following][0]
+    return (quarter, year)
+
 def parse_response(response):
     """
     Parses a JSON response from Banner
 
     Args:
         response (string):  The JSON response from Banner that needs to be 
-                            parsed.
+                            parsed, or an iterable of chunks of it.
     Returns:
-        A parsed object of the course registration data.
+        A list of the course registrations.
+
+    Raises:
+        BannerError: if the response is not registration data, the start of 
+                     the response is written to errors.log first.
     """
-    try:
-        parsed_json = json.loads(response)
-        term = parsed_json['data']['registrations'][0]['termDescription'] \
-            .replace(' ','_').lower()
-        if DEBUG:
-            dump_file = os.path.join(LOG_DIR, '{}_dump.json'.format(term))
-            with open(dump_file, 'w') as dump:
-                dump.write(response)
-    except json.decoder.JSONDecodeError:
+    if isinstance(response, str):
+        text = response
+        response = (text[i:i + CHUNK] for i in range(0, len(text), CHUNK))
+    if not DEBUG:
+        return list(iter_registrations(response))
+
+    # the dump is named after the term, which is only known once the first 
+    # course has been read
+    part_file = os.path.join(LOG_DIR, 'registration_dump.json.part')
+    with open(part_file, 'w') as dump:
+        registrations = list(iter_registrations(response, tee=dump.write))
+    term = registrations[0]['termDescription'].replace(' ','_').lower() \
+            if registrations else 'empty'
+    os.replace(part_file, os.path.join(LOG_DIR, '{}_dump.json'.format(term)))
+    return registrations
+
+def iter_registrations(chunks, tee=None):
+    """
+    Parses the registrations out of Banner registration JSON as it is read, 
+    one course at a time, so only the course being parsed is held in 
+    memory. An HTML error page is recognized from its first character, 
+    without reading the rest of it.
+
+    Args:
+        chunks (iterable)   the response text in chunks, i.e. as it arrives
+        tee (function)      optional, called with every chunk that is read, 
+                            i.e. to hash or dump the response
+    Returns:
+        A generator of the registrations as dicts. Every chunk has been read 
+        once it is exhausted.
+
+    Raises:
+        BannerError: if the response is not registration data, the start of 
+                     the response is written to errors.log first.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    state = { 'buffer' : '', 'head' : '', 'read' : 0, 'done' : False }
+
+    def more():
+        for chunk in chunks:
+            if tee is not None:
+                tee(chunk)
+            if state['read'] < ERROR_SNIPPET:
+                state['head'] += chunk[:ERROR_SNIPPET - state['read']]
+            state['read'] += len(chunk)
+            state['buffer'] += chunk
+            if chunk:
+                return True
+        state['done'] = True
+        return False
+
+    def unexpected(reason):
         # Error parsing JSON data, login probably failed?
-        print('Something went wrong... Did you enter the correct password?')
-        print('Check error log. Banner may also be unavailable right now.')
-        err_file = os.path.join(LOG_DIR, '{}_error.log'.format(
-            TODAY.strftime('%Y-%m-%d')))
-        with open(err_file, 'a') as dump:
-            dump.write(TODAY.strftime('### %Y-%m-%d : %H:%M'))
-            dump.write(str(response))
-            dump.write('\n\n')
+        if not SILENT:
+            print('Something went wrong... Did you enter the correct '
+                    'password?')
+            print('Check error log. Banner may also be unavailable right '
+                    'now.')
+        logs.log_event('errors', 'Unexpected response from Banner', 
+                logs.logging.ERROR, reason=reason, size=state['read'], 
+                response=state['head'])
+        return BannerError('Banner returned an unexpected response')
+
+    while not state['buffer'].strip():
+        if not more():
+            raise unexpected('empty')
+    if not state['buffer'].lstrip().startswith('{'):
+        raise unexpected('not JSON')
+
+    # skip ahead to the registrations array
+    while True:
+        found = REGISTRATIONS.search(state['buffer'])
+        if found:
+            break
+        # keep just enough to find the key across chunks
+        state['buffer'] = state['buffer'][-64:]
+        if not more():
+            raise unexpected('no registrations')
+    if found.group(1) == 'null':
+        pos = None
+    else:
+        pos = found.end()
+
+    while pos is not None:
+        while True:
+            while pos < len(state['buffer']) and \
+                    state['buffer'][pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(state['buffer']) or not more():
+                break
+        if pos >= len(state['buffer']):
+            raise unexpected('truncated')
+        if state['buffer'][pos] == ']':
+            break
+        if state['buffer'][pos] != '{':
+            raise unexpected('malformed')
+        try:
+            course, end = decoder.raw_decode(state['buffer'], pos)
+        except ValueError:
+            if not more():
+                raise unexpected('truncated')
+            continue
+        # drop what has been parsed
+        state['buffer'] = state['buffer'][end:]
+        pos = 0
+        yield course
+
+    # read the rest, so tee sees the whole response
+    while not state['done']:
+        state['buffer'] = ''
+        more()
+
+def account_key(key, account=None):
+    """
+    Scopes a cache key to an account. Keys for the default account are left 
+    as they are so existing caches keep working.
+
+    Args:
+        key (string)        the cache key, i.e. '_2017Winter'
+        account (string)    the netID the data belongs to, or None
+    Returns:
+        The scoped cache key
+    """
+    if account is None:
+        return key
+    return '{}{}'.format(account, key)
+
+def split_key(key):
+    """
+    Splits a cache key into its account and term, the reverse of 
+    account_key().
+
+    Args:
+        key (string)    the cache key, i.e. 'jdoe001_2017Spring'
+    Returns:
+        A tuple of the netID, None for the default account, and the term, 
+        i.e. ('jdoe001', '_2017Spring')
+    """
+    i = key.index('_')
+    return (key[:i] or None, key[i:])
+
+def key_account(key):
+    """
+    Gets the netID a cache key belongs to, i.e. for metric labels. Keys of 
+    the default account give its configured netID.
+    """
+    account = key.split('_', 1)[0] if '_' in key else ''
+    return account or get_config('netID', '')
 
-        exit(1)
+def load_json(text):
+    """
+    Parses JSON text, such as cached Banner data.
 
-    return parsed_json['data']['registrations']
+    Args:
+        text (string)   the JSON text
+    Returns:
+        The parsed object
+    """
+    with tracing.span('json.parse', size=len(text)):
+        return json.loads(text)
 
 def get_cached(key):
     """
     Gets last banner data from local cache, if available
 
     Args:
-        quarter (string)    the academic quarter being requested
-        year (string)       the academic year being requested
+        key (string)    the cache key, i.e. '_2017Winter'
     Returns:
-        The cached data if available, False if it's not
+        The cache entry if available, None if it's not. The 'data' of the 
+        entry is the projected registration JSON, and 'raw' holds the full 
+        response if it was cached with --debug.
     """
 
-    with shelve.open(os.path.join(DATA_DIR, data_file)) as cache:
-        if key in cache:
-            reg_data = cache[key]
-            return reg_data
-        else:
-            return None
+    account = key_account(key)
+    memory = memory_cache()
+    if _memory_version == store_version():
+        entry = memory.get(key)
+        if entry is not None:
+            metrics.inc('memory_cache_hits_total', account=account)
+            return dict(entry)
+    metrics.inc('memory_cache_misses_total', account=account)
 
-def cache_data(key, data):
+    try:
+        with tracing.span('cache.read', key=key), \
+                file_lock('cache', shared=True), \
+                shelve.open(os.path.join(DATA_DIR, data_file), 'r') as cache:
+            sync_memory()
+            if key not in cache:
+                metrics.inc('cache_misses_total', account=account)
+                return None
+            metrics.inc('cache_hits_total', account=account)
+            entry = decode_entry(cache[key])
+            # filled under the lock, so a write by another thread can't land 
+            # between the read and the put and leave this copy in memory
+            memory.put(key, entry)
+    except dbm.error:
+        # nothing has been cached yet
+        metrics.inc('cache_misses_total', account=account)
+        return None
+
+    return dict(entry)
+
+def iter_cached(keys, batch=CACHE_BATCH):
     """
-    Stores data into local cache
+    Reads many cache entries, opening the cache once per batch of keys 
+    rather than once per key. The cache lock is not held while the caller 
+    works through a batch, and the entries skip the in-memory cache.
+
+    Args:
+        keys (list)     the cache keys to read
+        batch (int)     entries read, and held in memory, at a time
+    Returns:
+        A generator of (key, entry) tuples, keys not in the cache are left 
+        out.
+    """
+
+    keys = list(keys)
+    for i in range(0, len(keys), batch):
+        try:
+            with tracing.span('cache.read', keys=len(keys[i:i + batch])), \
+                    file_lock('cache', shared=True), \
+                    shelve.open(os.path.join(DATA_DIR, data_file), 'r') as \
+                    cache:
+                records = [(key, cache[key]) for key in keys[i:i + batch] 
+                        if key in cache]
+        except dbm.error:
+            return
+        for key, record in records:
+            yield (key, decode_entry(record))
+
+def cache_data(key, data, headers=None, digest=None, raw=None):
+    """
+    Stores data into local cache, projected to the fields the utils use and 
+    compressed.
 
     Args:
         key (string)    a key to index the data under in the cache
-        data (?)        the data to store in the cache
+        data (string)   the registration JSON to store in the cache
+        headers (dict)  optional response headers, the ETag and Last-Modified 
+                        validators are kept for conditional requests
+        digest (string) optional fingerprint of the full response, when data 
+                        is an already projected copy of it (it is stored as 
+                        it is, without projecting it again)
+        raw (string)    optional full response kept with --debug, defaults 
+                        to data
+    """
+    headers = headers or {}
+    now = time.time()
+    record = { 'schema' : CACHE_SCHEMA, 
+            'dumpDate' : 
+                datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M'), 
+            'fetched' : now, 'changed' : now, 
+            'data' : zlib.compress((data if digest else 
+                project(data)).encode('utf-8')), 
+            'raw' : zlib.compress((raw or data).encode('utf-8')) if DEBUG 
+            else None, 
+            'hash' : digest or data_hash(data), 'etag' : headers.get('ETag'), 
+            'lastModified' : headers.get('Last-Modified') }
+    with tracing.span('cache.write', key=key), file_lock('cache'):
+        sync_memory()
+        with shelve.open(os.path.join(DATA_DIR, data_file)) as cache:
+            old = cache.get(key)
+            if old and old.get('hash') == record['hash']:
+                # only a refetch, the data last changed when it did before
+                record['changed'] = old.get('changed') or old.get('fetched') or now
+            cache[key] = record
+        sync_memory(written=True)
+        memory_cache().put(key, decode_entry(record))
+
+def touch_cached(key, headers=None):
+    """
+    Marks a cache entry as fetched now, i.e. after Banner answered a 
+    conditional request with 304 Not Modified, keeping its data as it is.
+
+    Args:
+        key (string)    the key of the entry in the cache
+        headers (dict)  optional response headers, with new ETag and 
+                        Last-Modified validators
+    Returns:
+        True if the entry was updated, False if it is not in the cache
+    """
+    headers = headers or {}
+    with tracing.span('cache.touch', key=key), file_lock('cache'):
+        sync_memory()
+        with shelve.open(os.path.join(DATA_DIR, data_file)) as cache:
+            record = cache.get(key)
+            if record is None:
+                return False
+            record['fetched'] = time.time()
+            record['etag'] = headers.get('ETag', record.get('etag'))
+            record['lastModified'] = headers.get('Last-Modified', 
+                    record.get('lastModified'))
+            cache[key] = record
+        sync_memory(written=True)
+        memory_cache().put(key, decode_entry(record))
+    return True
+
+def cache_keys():
+    """
+    Lists the keys in the local cache.
+
+    Returns:
+        A sorted list of cache keys, i.e. ['_2017Winter', 'jdoe001_2017Fall']
+    """
+
+    try:
+        with file_lock('cache', shared=True), \
+                shelve.open(os.path.join(DATA_DIR, data_file), 'r') as cache:
+            return sorted(cache.keys())
+    except dbm.error:
+        return []
+
+def cache_index():
+    """
+    Gets the hash of every entry in the local cache and when its data last 
+    changed, without decompressing any data, to find the entries that 
+    changed.
+
+    Returns:
+        A dict of cache key to { 'hash' : ..., 'changed' : ... }, changed is 
+        a timestamp or None for entries from before it was recorded.
+    """
+
+    index = {}
+    try:
+        with file_lock('cache', shared=True), \
+                shelve.open(os.path.join(DATA_DIR, data_file), 'r') as cache:
+            for key in cache.keys():
+                entry = cache[key]
+                index[key] = { 'hash' : entry.get('hash'), 
+                        'changed' : entry.get('changed') or 
+                        entry.get('fetched') }
+    except dbm.error:
+        pass
+    return index
+
+def memory_cache():
+    """
+    Gets the in-memory LRU of decoded cache entries.
+
+    Returns:
+        An lru.LRU, its stats() has the hit and miss counts of this process.
     """
-    with shelve.open(os.path.join(DATA_DIR, data_file)) as cache:
-        record = { key : '' }
-        record[key] = { 'dumpDate' : TODAY.strftime('%Y-%m-%d %H:%M'), 
-                'data' : data }
-        cache[key] = record[key]
+    global _memory
+    if _memory is None:
+        _memory = LRU(get_config('memory_cache_entries', MEMORY_ENTRIES), 
+                get_config('memory_cache_bytes', MEMORY_BYTES), 
+                sizeof=lambda entry: len(entry['data']) + 
+                len(entry.get('raw') or ''))
+    return _memory
+
+def store_version():
+    """
+    Fingerprints the files of the persistent cache, so entries in memory can 
+    be checked against writes made by other processes with a stat instead of 
+    a read.
+
+    Returns:
+        A tuple of (name, mtime, size) of the reg.db files.
+    """
+    version = []
+    for name in sorted(os.listdir(DATA_DIR)):
+        if name.startswith(data_file):
+            stat = os.stat(os.path.join(DATA_DIR, name))
+            version.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+def sync_memory(written=False):
+    """
+    Drops the entries in memory if the persistent cache changed since they 
+    were read. Callers hold the cache lock.
+
+    Args:
+        written (bool)  the change was this process's own write, made while 
+                        the entries were in sync
+    """
+    global _memory_version
+    version = store_version()
+    if version != _memory_version and not written:
+        memory_cache().invalidate()
+    _memory_version = version
+
+def decode_entry(entry):
+    """
+    Unpacks a stored cache entry. Entries from before CACHE_SCHEMA hold the 
+    full response and are projected as they are read.
+
+    Args:
+        entry (dict)    the entry as stored in the shelve
+    Returns:
+        The entry with 'data' (and 'raw') as text
+    """
+    entry = dict(entry)
+    if entry.get('schema') != CACHE_SCHEMA:
+        entry['raw'] = entry['data'] if DEBUG else None
+        entry['data'] = project(entry['data'])
+        return entry
+
+    entry['data'] = zlib.decompress(entry['data']).decode('utf-8')
+    if entry.get('raw'):
+        entry['raw'] = zlib.decompress(entry['raw']).decode('utf-8')
+    return entry
+
+def project(data):
+    """
+    Strips registration JSON down to the COURSE_FIELDS, MEETING_FIELDS and 
+    FACULTY_FIELDS of each course.
+
+    Args:
+        data (string)   the registration JSON from Banner
+    Returns:
+        Compact JSON text with the same layout, or data as it is if it is not 
+        registration data
+    """
+    try:
+        registrations = json.loads(data)['data']['registrations']
+    except (ValueError, TypeError, KeyError):
+        return data
+
+    return dump_courses([project_course(course) for course in 
+        registrations or []])
+
+def project_course(course):
+    """
+    Strips one registration down to the fields the utils read.
+    """
+    projected = dict((k, course.get(k)) for k in COURSE_FIELDS)
+    projected['meetingTimes'] = [dict((k, times.get(k)) 
+        for k in MEETING_FIELDS) for times in course.get('meetingTimes') 
+        or []]
+    projected['faculty'] = [dict((k, faculty.get(k)) 
+        for k in FACULTY_FIELDS) for faculty in course.get('faculty') 
+        or []]
+    return projected
+
+def dump_courses(courses):
+    """
+    Writes projected courses as the compact registration JSON kept in the 
+    cache.
+    """
+    return json.dumps({ 'data' : { 'registrations' : courses } }, 
+            separators=(',', ':'))
+
+def data_hash(data):
+    """
+    Creates a short fingerprint of cached data, used to tell if a response 
+    changed without parsing it.
+
+    Args:
+        data (string)   the data to fingerprint
+    Returns:
+        A hex digest string
+    """
+    if not isinstance(data, bytes):
+        data = str(data).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+@contextmanager
+def file_lock(name, shared=False):
+    """
+    Holds a lock shared by every process using DATA_DIR for the duration of a 
+    with block.
+
+    Args:
+        name (string)   the name of the lock, any characters other than 
+                        letters, digits, '-' and '_' are replaced
+        shared (bool)   take a shared (read) lock instead of an exclusive one
+    """
+    safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+    lock_file = os.path.join(DATA_DIR, '{}.lock'.format(safe_name))
+    with open(lock_file, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
 
 # def run_process(process):
 #     run(process.split())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+    banner_async.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    asyncio versions of get_session, get_schedule, get_gpa and
+    get_final_grades, so one event loop can drive many accounts at once.
+    Responses go through the same parsers and cache as the blocking utils.
+
+    Requires aiohttp (pip install aiohttp).
+"""
+import anti_banner as app
+import asyncio
+import cassette
+import functools
+import metrics
+import random
+import rate_limit
+import tracing
+import banner_connect as bc
+from collections import namedtuple
+from gpa import profile_url, parse_gpa
+from final_grades import login_url, grades_url, extract_course_info
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# connections kept open across all hosts, and requests in flight per host
+POOL_SIZE = 100
+CONCURRENCY = {
+        'default' : 8,
+        }
+
+# Just enough of a requests.Response for the shared parsers
+Response = namedtuple('Response',
+        ['status_code', 'url', 'text', 'content', 'headers'])
+
+def blocking(func, *args, **kwargs):
+    """
+    Runs a blocking call, i.e. one that takes a file lock or opens the cache,
+    in the loop's default executor so it doesn't stall the other requests.
+
+    Returns:
+        An awaitable of the call's result.
+    """
+    return asyncio.get_event_loop().run_in_executor(None,
+            functools.partial(func, *args, **kwargs))
+
+class Client(object):
+    """
+    An async Banner client with a shared connection pool. Each login gets its
+    own cookie jar, so one client can serve many accounts.
+
+    Examples:
+        >>> async with Client() as client:
+        ...     data = await client.get_schedule('spring', '2017')
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, concurrency=None):
+        if aiohttp is None:
+            raise ImportError('banner_async requires aiohttp, ' + \
+                    'install it with `pip install aiohttp`')
+        self.pool_size = pool_size
+        self.concurrency = dict(CONCURRENCY)
+        self.concurrency.update(concurrency or {})
+        self.connector = None
+        self._limits = {}
+        self._flights = {}
+
+    async def __aenter__(self):
+        self.connector = aiohttp.TCPConnector(limit=self.pool_size)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.connector.close()
+
+    def _limit(self, host):
+        if host not in self._limits:
+            self._limits[host] = asyncio.Semaphore(
+                    self.concurrency.get(host, self.concurrency['default']))
+        return self._limits[host]
+
+    async def fetch(self, session, method, url, **kwargs):
+        """
+        The async counterpart of banner_connect.fetch, with the same
+        timeouts, retries, circuit breaker and rate limits, plus a cap on
+        requests in flight per host.
+
+        Args:
+            session (aiohttp.ClientSession):    The session to send with.
+            method (string):                    The HTTP method, i.e. 'GET'.
+            url (string):                       The url to request.
+            kwargs:                             Passed on to
+                                                session.request().
+
+        Returns:
+            A Response with the body already read.
+
+        Raises:
+            BannerUnavailable: if the breaker is open or every attempt failed.
+        """
+        if cassette.replaying():
+            return cassette.play(method, url)
+
+        host = bc.urlparse(url).netloc
+        if await blocking(bc.breaker_open, host):
+            raise bc.BannerUnavailable('{} is unavailable, try again later'
+                    .format(host))
+
+        kwargs.setdefault('timeout', aiohttp.ClientTimeout(
+            sock_connect=bc.TIMEOUT[0], sock_read=bc.TIMEOUT[1]))
+        # a POST is only safe to resend if it never reached the server, i.e.
+        # the connection could not be opened
+        retry_on = aiohttp.ClientConnectorError if method != 'GET' else \
+                (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+        for attempt in range(bc.RETRIES + 1):
+            # the lock is taken in the executor, the wait for a token is 
+            # spent on the loop so it doesn't tie up an executor thread
+            wait = await blocking(rate_limit.try_acquire, host)
+            while wait:
+                with tracing.span('rate_limit.wait', host=host):
+                    await asyncio.sleep(wait)
+                wait = await blocking(rate_limit.try_acquire, host)
+            try:
+                async with self._limit(host):
+                    response, body = await self._request(session, method,
+                            url, attempt, **kwargs)
+                if cassette.recording():
+                    await blocking(cassette.record, method, url,
+                            response.status_code, response.url,
+                            response.headers, body)
+                if response.status_code not in bc.RETRY_STATUS:
+                    await blocking(bc.record_result, host, True)
+                    return response
+                error = 'HTTP {}'.format(response.status_code)
+            except retry_on as e:
+                error = str(e) or type(e).__name__
+            except aiohttp.ClientError as e:
+                await blocking(bc.record_result, host, False)
+                metrics.inc('request_failures_total', host=host)
+                raise bc.BannerUnavailable('{} failed: {}'.format(host, e))
+
+            if attempt < bc.RETRIES:
+                await asyncio.sleep(bc.BACKOFF * 2 ** attempt *
+                        (1 + random.random()))
+
+        await blocking(bc.record_result, host, False)
+        metrics.inc('request_failures_total', host=host)
+        raise bc.BannerUnavailable('{} failed after {} attempts: {}'.format(
+            host, bc.RETRIES + 1, error))
+
+    async def _request(self, session, method, url, attempt, **kwargs):
+        with tracing.span(bc.span_name(method, url), attempt=attempt):
+            async with session.request(method, url, **kwargs) as resp:
+                body = await resp.read()
+                return (Response(resp.status, resp.url, body.decode(
+                    resp.charset or 'utf-8', 'replace'), body, resp.headers),
+                    body)
+
+    async def get_session(self, url=None, headers=None, login=None):
+        """
+        Logs in through CAS, like banner_connect.get_session().
+
+        Args:
+            url (string):       A url that redirects to the CAS login,
+                                defaults to the CAS login page.
+            headers (dict):     Optional extra headers for the login POST.
+            login (tuple):      Optional (netID, password), defaults to the
+                                credentials from get_login().
+
+        Returns:
+            A tuple containing an aiohttp.ClientSession, which the caller
+            must close, and the POST Response.
+        """
+        url = url or bc.base_url('auth') + '/cas/login'
+        login = login or app.get_login()
+        session = aiohttp.ClientSession(connector=self.connector,
+                connector_owner=False, headers={'Accept-Encoding' : 'gzip'})
+        try:
+            response = await self.fetch(session, 'GET', url)
+            post_url, payload = bc.login_form(response.text, login)
+            metrics.inc('logins_total', account=login[0])
+            response = await self.fetch(session, 'POST', post_url,
+                    data=payload, headers=headers)
+        except:
+            await session.close()
+            raise
+        return (session, response)
+
+    async def get_schedule(self, quarter, year, login=None, fallback=True):
+        """
+        Gets the registration history for a quarter and year, like
+        banner_connect.get_schedule(). Concurrent calls for the same account
+        and term share one fetch.
+
+        Args:
+            quarter (string):   The academic quarter for the request.
+            year (string):      The academic year for the request.
+            login (tuple):      Optional (netID, password). Data for an
+                                explicit login is cached under that account.
+            fallback (bool):    Return the cached copy if Banner is
+                                unavailable, instead of raising.
+
+        Returns:
+            The raw JSON response text from Banner, or the cached copy if
+            Banner is unavailable and fallback is True.
+        """
+        term = app.account_key('_' + year + quarter,
+                login[0] if login else None)
+        if app.CACHED:
+            data = await blocking(app.get_cached, term)
+            if data:
+                return data['data']
+
+        flight = (term, 'registrationHistory')
+        if flight not in self._flights:
+            self._flights[flight] = asyncio.ensure_future(
+                    self._fetch_schedule(quarter, year, term, login))
+            self._flights[flight].add_done_callback(
+                    lambda f: self._flights.pop(flight, None))
+        try:
+            return await asyncio.shield(self._flights[flight])
+        except bc.BannerUnavailable:
+            if not fallback:
+                raise
+            data = await blocking(app.get_cached, term)
+            if data:
+                return data['data']
+            raise
+
+    async def _fetch_schedule(self, quarter, year, term, login):
+        cached = await blocking(app.get_cached, term)
+        session, response = await self.get_session(
+                bc.schedule_url(quarter, year),
+                headers=bc.conditional_headers(cached), login=login)
+        await session.close()
+        # parses the response and writes the cache, under the cache lock
+        return await blocking(bc.store_schedule, term, cached, response)
+
+    async def get_gpa(self, sid, login=None):
+        """
+        Gets the overall GPA for a sid, like gpa.get_gpa().
+
+        Args:
+            sid (string):   The student id to retrieve the GPA for.
+            login (tuple):  Optional (netID, password).
+
+        Returns:
+            The overall GPA as a string, or None.
+        """
+        if sid is None:
+            return None
+        session, response = await self.get_session(login=login)
+        try:
+            # need to load student profile first before API is active
+            await self.fetch(session, 'GET', profile_url())
+            response = await self.fetch(session, 'GET',
+                    profile_url() + '/viewGPAHoursList?studentId=' + sid)
+        finally:
+            await session.close()
+        return parse_gpa(response.text)
+
+    async def get_final_grades(self, quarter, year, login=None):
+        """
+        Gets final grades from RWeb, like final_grades.get_final_grades().
+
+        Args:
+            quarter (string):   The academic quarter for the request.
+            year (string):      The academic year for the request.
+            login (tuple):      Optional (netID, password).
+
+        Returns:
+            A list of Course.
+        """
+        session, response = await self.get_session(login_url(), login=login)
+        try:
+            response = await self.fetch(session, 'GET',
+                    grades_url(quarter, year))
+        finally:
+            await session.close()
+        return extract_course_info(response.content)
@@ -9,94 +9,44 @@
     quarter and year.
 """
 import anti_banner as app
+import leases
+import logs
+import metrics
+import planner
+import sinks
+import time
 from banner_connect import get_schedule
-import requests
+from model import load_courses, diff_courses
 
 app_name = 'Changes'
 version = '1.0'
 
-def notify(data):
+def log_entry(data, level=logs.logging.INFO, **fields):
     """
-    Sends a POST request with data to trigger a notification.
-
-    Args:
-        data (string):  The data to include in the notification (i.e. the 
-        new changes)
-    """
-    err = "Error finding API key!"
-    ifttt_channel = 'banner_changes'
-    ifttt = 'https://maker.ifttt.com/trigger/' + ifttt_channel + '/with/key/'
-    pb = "https://api.pushbullet.com/v2/pushes"
-    credentials = {}
-
-    if app.args['c']:
-        with open(app.args['c']) as cas:
-            credentials = app.json.loads(cas.read())
-        try:
-            with open(app.args['c']) as cas:
-                credentials = app.json.loads(cas.read())
-        except:
-            print(err)
-            print('{} is not a valid path.'.format(app.args['c']))
-            log_entry(err)
-            exit(1)
-    else:
-        try:
-            with open(os.path.join(PROJ_ROOT, 'credentials.json')) as cas:
-                credentials = app.json.loads(cas.read())
-        except:
-            print(err)
-            log_entry(err)
-            exit(1)
-
-    ifttt_payload = { 'value1' : data }
-    pb_payload = { 
-            'type' : 'note',
-            'title' : 'New grades!',
-            'body' : data
-            }
-
-    if not data:
-        pb_payload['body'] = ''
-
-    if credentials['pushbullet']:
-        return requests.post(pb, auth=(credentials['pushbullet'], ''), 
-                data=pb_payload)
-    # if credentials['ifttt']:
-    #     return requests.post(ifttt + credentials['ifttt'], data=ifttt_payload)
-    else:
-        print(err)
-        log_entry(err)
-
-def log_entry(data):
-    """
-    Creates a log entry with a timestamp and data.
+    Creates a structured log entry in changes.log.
     
     Args:
-        data (string): the data to accompany the log entry.
+        data (string):  the data to accompany the log entry.
+        level (int):    the logging level of the entry.
+        fields:         extra fields for the entry, i.e. term='_2017Spring'
     """
-    now = app.datetime.now()
-    timestamp = now.strftime('%Y-%m-%d-%H:%M')
-    changes = app.os.path.join(app.LOG_DIR, 'changes.log')
-    with open(changes, 'a') as log:
-        log.write('{}: {}\n'.format(timestamp, data))
+    logs.log_event('changes', data, level, **fields)
 
 def grades_string(courses):
     """
     Creates a response string with all grades.
 
     Args:
-        courses (object): a courses object returned from cached_data
+        courses (list): a list of Course
     """
     grades = ''
     # Check that we have received something worthwhile
     if len(courses) > 0:
         no_grades = True
         for course in courses:
-            if course['grade']:
-                subject = '{}{}: '.format(course['subject'], 
-                        course['courseNumber'])
-                grades += '{0:<9}{1:2}\n'.format(subject, course['grade'])
+            if course.grade:
+                subject = '{}{}: '.format(course.subject, course.number)
+                grades += '{0:<9}{1:2}\n'.format(subject, course.grade)
                 no_grades = False
 
         if no_grades:
@@ -104,51 +54,148 @@ def grades_string(courses):
 
     return grades
 
-def main():
+def has_changed(old, new):
     """
-    Checks for a change in Banner registration data since last GET
+    Compares two cache entries for the same term. Entries with matching 
+    hashes are unchanged without parsing either of them.
+
+    Args:
+        old (dict): the cache entry from before the latest GET
+        new (dict): the cache entry after the latest GET
+
+    Returns:
+        True if the registration data differs.
     """
+    if old.get('hash') and old.get('hash') == new.get('hash'):
+        return False
+    try:
+        return app.load_json(old['data']) != app.load_json(new['data'])
+    except ValueError:
+        # the old entry was not valid registration data
+        return True
 
-    if not app.SILENT:
-        app.print_greeting(module=app_name, version=version)
+def check_account(quarter, year, login=None):
+    """
+    Polls Banner for one account and notifies about any new changes.
 
-    quarter,year = app.get_user_input()
+    Args:
+        quarter (string):   The academic quarter.
+        year (string):      The academic year.
+        login (tuple):      Optional (netID, password), defaults to the 
+                            credentials from get_login().
+
+    Returns:
+        False if Banner did not return usable data, otherwise True.
+    """
     term = '_{}{}'.format(year, quarter)
+    key = app.account_key(term, login[0] if login else None)
     class_schedule = '{} {}'.format(quarter, year)
+    account = login[0] if login else app.current_account()
 
-    try:
-        cached_data = app.json.loads(app.get_cached(term)['data'])
-    except:
+    cached = app.get_cached(key)
+    if cached is None:
         if not app.SILENT:
             print('First run for this quarter/year combination...')
-        reg = get_schedule(quarter, year)
-        cached_data = app.json.loads(app.get_cached(term)['data'])
-        pass
+        try:
+            reg = get_schedule(quarter, year, login=login)
+        except app.BannerError as e:
+            metrics.inc('banner_errors_total', account=account)
+            log_entry('Banner error', logs.logging.ERROR, error=str(e), 
+                    account=account, term=term)
+            return False
+        cached = app.get_cached(key)
 
     if app.TEST:
-        body = grades_string(cached_data['data']['registrations'])
+        body = grades_string(load_courses(cached['data']))
         test_msg = '***TEST***\n{}***TEST***'.format(body)
-        res = notify(test_msg)
-        print(res.text)
+        for sink, error in sinks.send_now(sinks.change_event(account, key, 
+                quarter, year, cached['hash'], test_msg, [])):
+            print('{}: {}'.format(sink, error or 'sent'))
         print(test_msg)
         exit(0)
 
-    reg = get_schedule(quarter, year)
-    new_data = app.json.loads(app.get_cached(term)['data'])
-
-    if (cached_data != new_data):
-        log_entry('New changes')
-        if not app.SILENT:
-            print('New changes!')
-        body = grades_string(new_data['data']['registrations'])
-        res = notify(body)
-        log_entry('Notification result: {}'.format(res.status_code))
-        if res.status_code != 200:
-            log_entry('Notification error: {}\n'.format(res.text))
+    when, reason = planner.plan(account + term, cached)
+    if not app.args['force'] and (when is None or when > time.time()):
+        metrics.inc('polls_skipped_total', account=account, reason=reason)
+        if not app.SILENT and when is None:
+            print('Every {} course has a grade, not polling.'.format(
+                class_schedule))
+        elif not app.SILENT:
+            print('Not polling {} until {} ({}).'.format(class_schedule, 
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(when)), reason))
+        return True
+
+    metrics.inc('polls_total', account=account)
+    try:
+        # no fallback: a cached copy would pass for a poll that found nothing
+        reg = get_schedule(quarter, year, login=login, fallback=False)
+    except app.BannerError as e:
+        metrics.inc('banner_errors_total', account=account)
+        log_entry('Banner error', logs.logging.ERROR, error=str(e), 
+                account=account, term=term)
+        return False
+    new = app.get_cached(key)
+    metrics.set_gauge('last_poll_timestamp_seconds', time.time(), 
+            account=account)
+
+    changed = has_changed(cached, new)
+    if not app.CACHED:
+        # only a poll that reached Banner says whether the term is quiet
+        planner.record(account + term, changed)
+    if changed:
+        courses = load_courses(new['data'])
+        changes = diff_courses(load_courses(cached['data']), courses)
+        claim = leases.claim_notification(account, term, new['hash'], 
+                sinks.change_event(account, key, quarter, year, new['hash'], 
+                    grades_string(courses), changes))
+        if claim is None:
+            # another worker is sending or already sent this change
+            log_entry('Already notified', account=account, term=term)
+        else:
+            metrics.inc('changes_total', account=account)
+            log_entry('New changes', account=account, term=term)
+            if not app.SILENT:
+                print('New changes!')
+            notify(account, term, claim)
     else:
-        log_entry('')
+        logs.log_quiet('changes', 'Nothing new', account=account, term=term)
         if not app.SILENT:
             print('Nothing new for {} {}'.format(quarter, year))
+        # a change that not every sink confirmed is sent again
+        claim = leases.claim_notification(account, term, new['hash'])
+        if claim is not None:
+            log_entry('Resending notification', account=account, term=term)
+            notify(account, term, claim)
+    return True
+
+def notify(account, term, claim):
+    """
+    Hands a claimed change to the sinks that don't have it yet. Each sink
+    confirms it once sent, the change counts as notified when all did.
+
+    Args:
+        account (string):   The netID.
+        term (string):      The term, i.e. '_2017Spring'.
+        claim (tuple):      The event and the sinks that already sent it, 
+                            from leases.claim_notification().
+    """
+    event, delivered = claim
+    names = [sink.name for sink in sinks.get_sinks()]
+    # the sinks send it in the background, polling goes on
+    sinks.publish(event, lambda sink: leases.confirm_delivery(account, term, 
+        event['hash'], sink, names), skip=delivered)
+
+def main():
+    """
+    Checks for a change in Banner registration data since last GET
+    """
+
+    if not app.SILENT:
+        app.print_greeting(module=app_name, version=version)
+
+    quarter,year = app.get_user_input()
+    if not check_account(quarter, year):
+        exit(1)
 
 if __name__ == "__main__":
     main()
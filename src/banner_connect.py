@@ -8,55 +8,382 @@
     Utils for connecting to banner and retreiving data
 """
 import anti_banner as app
+import cassette
+import metrics
+import rate_limit
 import requests
-import re
+import snapshots
+import tracing
+import codecs
+import hashlib
 import json
+import os
+import random
+import threading
+import time
 from sys import exit
+try:
+    from html.parser import HTMLParser
+    from urllib.parse import urljoin, urlparse
+except ImportError:
+    from HTMLParser import HTMLParser
+    from urlparse import urljoin, urlparse
 
-def get_session(url='https://auth.ucr.edu/cas/login'):
+# (connect, read) timeouts in seconds for every outbound request
+TIMEOUT = (5, 30)
+RETRIES = 3
+BACKOFF = 1
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# consecutive failures before a host's breaker opens, and seconds it stays 
+# open before a probe request is let through
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 300
+breaker_file = 'breaker.json'
+
+_flights = {}
+_flights_lock = threading.Lock()
+# cookies of the last login of each account, tried before logging in again
+_cookies = {}
+_cookies_lock = threading.Lock()
+
+class _Flight(object):
+    """
+    A fetch in progress that other callers can wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class BannerUnavailable(app.BannerError):
+    """
+    Raised when a host cannot be reached or its circuit breaker is open.
+    """
+    pass
+
+# Override with a "base_urls" entry in credentials.json, i.e. to point 
+# everything at a local stand-in server
+BASE_URLS = {
+        'auth' : 'https://auth.ucr.edu',
+        'registration' : 'https://registrationssb.ucr.edu',
+        'profile' : 'https://studentssb.ucr.edu',
+        'sso' : 'https://bannersso.ucr.edu:443',
+        'rweb' : 'https://banweb.ucr.edu',
+        }
+
+def base_url(name):
     """
-    Connects to ucr.edu and returns an authenticated session.
+    Gets the scheme and host to use for one of the UCR services.
 
     Args:
-        url (string):   A url to an authentication portal or that redirects 
-                        to an authentication portal.
+        name (string):  One of the keys of BASE_URLS, i.e. 'auth'.
+
+    Returns:
+        The base url as a string, without a trailing slash.
+    """
+    return app.get_config('base_urls', {}).get(name, BASE_URLS[name])
+
+def get_session(url=None, headers=None, login=None, stream=False):
+    """
+    Connects to ucr.edu and returns an authenticated session. The cookies of 
+    the account's last login are tried first, and while they are still good 
+    the CAS login is skipped.
+
+    Args:
+        url (string):       A url to an authentication portal or that 
+                            redirects to an authentication portal, defaults 
+                            to the CAS login page.
+        headers (dict):     Optional extra headers for the request to url, 
+                            sent again with the login POST, which redirects 
+                            back to url once authenticated.
+        login (tuple):      Optional (netID, password) to log in with instead 
+                            of the credentials from get_login().
+        stream (bool):      Leave the body of the final response unread, to 
+                            be read in chunks with response_chunks().
 
     Returns:
         A tuple containing a requests Session object for the session, 
-        and the POST response.
+        and the final response.
 
     Examples:
         >>> get_session('rweb.ucr.edu')
     """
-    auth_url = 'https://auth.ucr.edu'
+    url = url or base_url('auth') + '/cas/login'
+    login = login or app.get_login()
     session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip'
+    with _cookies_lock:
+        session.cookies.update(_cookies.get(login[0], {}))
 
     # Navigate to schedule url
-    response = session.get(url)
+    response = fetch(session, 'GET', url, headers=headers, stream=True)
+    on_login = login_page(response.url)
+    form = on_login and read_form(response_chunks(response))
+    if not form:
+        # the session is still good, url was served without a login
+        metrics.inc('logins_skipped_total', account=login[0])
+        if not stream and not on_login:
+            # read the body now, which also returns the connection to the 
+            # pool, as a caller that didn't ask to stream won't close it
+            response.content
+        return (session, response)
+    if hasattr(response, 'close'):
+        # the rest of the login page is not needed
+        response.close()
+
+    # Submit the CAS login form
+    login_url, payload = fill_form(form, login)
+    metrics.inc('logins_total', account=login[0])
+    response = fetch(session, 'POST', login_url, data=payload, 
+            headers=headers, stream=stream)
+    if not login_page(response.url):
+        with _cookies_lock:
+            _cookies[login[0]] = session.cookies.copy()
+    return (session, response)
+
+class LoginFormParser(HTMLParser):
+    """
+    Picks the action and hidden inputs of the first form with a password 
+    input out of a page, in one pass. Once that form is closed, done is set 
+    and the rest of the page can be left unread.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.done = False
+        self.reset_form()
+
+    def reset_form(self):
+        self.in_form = False
+        self.has_password = False
+        self.action = None
+        self.fields = {}
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        attrs = dict(attrs)
+        if tag == 'form':
+            self.reset_form()
+            self.in_form = True
+            self.action = attrs.get('action') or ''
+        elif tag == 'input' and self.in_form:
+            kind = (attrs.get('type') or 'text').lower()
+            if kind == 'password':
+                self.has_password = True
+            elif kind == 'hidden' and attrs.get('name'):
+                self.fields[attrs['name']] = attrs.get('value') or ''
+
+    def handle_endtag(self, tag):
+        if tag == 'form' and self.in_form:
+            self.done = self.has_password
+            self.in_form = False
+
+def read_form(chunks):
+    """
+    Reads a page up to the end of its login form.
+
+    Args:
+        chunks (iterable):  The page text, whole or in chunks.
+
+    Returns:
+        A tuple with the form action and a dict of its hidden inputs, or 
+        None if there is no login form on the page.
+    """
+    parser = LoginFormParser()
+    # the head of the page (styles, scripts) is skipped, not parsed
+    skipped = ''
+    for chunk in [chunks] if isinstance(chunks, str) else chunks:
+        if skipped is not None:
+            skipped += chunk
+            start = skipped.lower().find('<form')
+            if start < 0:
+                skipped = skipped[-len('<form'):]
+                continue
+            chunk, skipped = skipped[start:], None
+        # fed up to each closing form tag, so nothing after the login form 
+        # is parsed
+        while chunk:
+            end = chunk.find('>', chunk.lower().find('</form') + 1)
+            if chunk.lower().find('</form') < 0 or end < 0:
+                end = len(chunk) - 1
+            parser.feed(chunk[:end + 1])
+            chunk = chunk[end + 1:]
+            if parser.done:
+                return (parser.action, parser.fields)
+    return None
 
-    # construct POST URL from form action url
-    auth_url += find_action(parse_html(response.text, 'action'))
+def fill_form(form, login):
+    """
+    Fills in a login form from read_form().
 
-    credentials = {}
-    credentials['netID'], credentials['password'] = app.get_login()
+    Args:
+        form (tuple):   The form action and hidden inputs.
+        login (tuple):  The (netID, password) to log in with.
 
-    payload = {
-            'username' : credentials['netID'],
-            'password' : credentials['password'],
-            'lt' : find_lt(parse_html(response.text, 'name="lt"')),
-            'execution' : 'e1s1',
-            '_eventId' : 'submit',
+    Returns:
+        A tuple with the url to POST the form to and the form payload.
+    """
+    action, fields = form
+    payload = { '_eventId' : 'submit' }
+    # lt, execution and the like, as the page has them
+    payload.update(fields)
+    payload.update({
+            'username' : login[0],
+            'password' : login[1],
             'submit.x' : 45,
             'submit.y' : 16,
             'submit' : 'LOGIN'
-            }
+            })
 
-    # Submit the CAS login form
-    response = session.post(auth_url, data=payload)
-    return (session, response)
+    return (urljoin(base_url('auth') + '/cas/login', action), payload)
+
+def login_form(html, login):
+    """
+    Fills in the CAS login form from a login page.
+
+    Args:
+        html (string):  The CAS login page, whole or in chunks.
+        login (tuple):  The (netID, password) to log in with.
+
+    Returns:
+        A tuple with the url to POST the form to and the form payload.
+
+    Raises:
+        BannerError: if there is no login form on the page.
+    """
+    form = read_form(html)
+    if form is None:
+        raise app.BannerError('CAS did not send a login form')
+    return fill_form(form, login)
+
+def fetch(session, method, url, **kwargs):
+    """
+    Sends a request with a bounded timeout, retrying connection errors and 
+    transient server errors with exponential backoff. Every attempt waits its 
+    turn in the shared per-host rate limiter. Hosts that keep failing 
+    trip a circuit breaker persisted in DATA_DIR, and requests to them fail 
+    fast until the cooldown passes and a probe request succeeds.
+
+    Args:
+        session (requests.Session): The session to send the request with.
+        method (string):            The HTTP method, i.e. 'GET'.
+        url (string):               The url to request.
+        kwargs:                     Passed on to session.request().
+
+    Returns:
+        The requests.Response.
+
+    Raises:
+        BannerUnavailable: if the breaker is open or every attempt failed.
+    """
+    if cassette.replaying():
+        return cassette.play(method, url)
+
+    host = urlparse(url).netloc
+    if breaker_open(host):
+        raise BannerUnavailable('{} is unavailable, try again later'
+                .format(host))
+
+    kwargs.setdefault('timeout', TIMEOUT)
+    # a POST is only safe to resend if it never reached the server
+    retry_on = requests.exceptions.ConnectionError if method != 'GET' else \
+            (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+    for attempt in range(RETRIES + 1):
+        rate_limit.acquire(host)
+        try:
+            with tracing.span(span_name(method, url), attempt=attempt):
+                response = session.request(method, url, **kwargs)
+            if cassette.recording():
+                cassette.record(method, url, response.status_code, 
+                        response.url, response.headers, response.content)
+            if response.status_code not in RETRY_STATUS:
+                record_result(host, True)
+                return response
+            error = 'HTTP {}'.format(response.status_code)
+        except retry_on as e:
+            error = str(e)
+        except requests.exceptions.RequestException as e:
+            record_result(host, False)
+            metrics.inc('request_failures_total', host=host)
+            raise BannerUnavailable('{} failed: {}'.format(host, e))
+
+        if attempt < RETRIES:
+            time.sleep(BACKOFF * 2 ** attempt * (1 + random.random()))
+
+    record_result(host, False)
+    metrics.inc('request_failures_total', host=host)
+    raise BannerUnavailable('{} failed after {} attempts: {}'.format(host, 
+        RETRIES + 1, error))
+
+def span_name(method, url):
+    """
+    Names the tracing span of a request by method, host and path.
+    """
+    url = urlparse(url)
+    return 'http.{} {}{}'.format(method, url.netloc, url.path.split(';')[0])
+
+def breaker_open(host):
+    """
+    Checks if the circuit breaker for a host is open.
+
+    Args:
+        host (string):  The host to check, i.e. 'auth.ucr.edu'.
+
+    Returns:
+        True if requests to the host should not be attempted right now.
+    """
+    state = load_breaker().get(host)
+    if state is None or state['failures'] < BREAKER_THRESHOLD:
+        return False
+    return time.time() - state['opened'] < BREAKER_COOLDOWN
+
+def record_result(host, ok):
+    """
+    Updates the circuit breaker for a host after a request. breaker.json is 
+    only locked and written when the host's state changes, so the usual 
+    success against a healthy host costs one read.
+
+    Args:
+        host (string):  The host the request was sent to.
+        ok (bool):      Whether the request succeeded.
+    """
+    if ok and host not in load_breaker():
+        return
+    with app.file_lock('breaker'):
+        breaker = load_breaker()
+        if ok:
+            if host not in breaker:
+                # another process closed it in the meantime
+                return
+            del breaker[host]
+        else:
+            state = breaker.setdefault(host, {'failures' : 0, 'opened' : 0})
+            state['failures'] += 1
+            if state['failures'] >= BREAKER_THRESHOLD:
+                state['opened'] = time.time()
+        path = os.path.join(app.DATA_DIR, breaker_file)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(breaker, f)
+        os.replace(path + '.tmp', path)
+
+def load_breaker():
+    """
+    Loads the circuit breaker state of every host from DATA_DIR.
+
+    Returns:
+        A dict of host to {'failures', 'opened'}.
+    """
+    try:
+        with open(os.path.join(app.DATA_DIR, breaker_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
 
 
-def get_schedule(quarter, year):
+def get_schedule(quarter, year, login=None, fallback=True):
     """
     Connects to Banner and returns a JSON object of a student class schedule 
     for a particular quarter and year.
@@ -64,52 +391,235 @@ def get_schedule(quarter, year):
     Args:
         quarter (string):    The academic quarter for the schedule request.
         year (string):       The academic year for the schedule request.
+        login (tuple):       Optional (netID, password). Data for an explicit 
+                             login is cached under that account.
+        fallback (bool):     Return the cached copy if Banner is unavailable. 
+                             Pollers pass False, so a stale copy is never 
+                             mistaken for a fresh poll.
 
     Returns:
         A JSON object containing registered classes for the given search data.
+        If Banner is unavailable, the cached copy is returned instead, unless 
+        fallback is False.
+
+    Raises:
+        BannerUnavailable: if Banner is unavailable and fallback is False or 
+            nothing is cached.
+        BannerError: if there is no usable data from Banner or the cache.
 
     Examples:
         >>> get_schedule('spring','2017')
     """
-    term = '_' + year + quarter
+    term = app.account_key('_' + year + quarter, login[0] if login else None)
     if app.CACHED:
         data = app.get_cached(term)
         if data:
             return data['data']
 
-    sched_url = 'https://registrationssb.ucr.edu/StudentRegistrationSsb/' + \
+    requested = time.time()
+    account = login[0] if login else app.current_account()
+    key = (account, term, 'registrationHistory')
+    try:
+        return single_flight(key, 
+                lambda: fetch_schedule(quarter, year, requested, login))
+    except BannerUnavailable:
+        if not fallback:
+            raise
+        # serve the last good copy while Banner is down
+        data = app.get_cached(term)
+        if data:
+            return data['data']
+        raise
+
+def fetch_schedule(quarter, year, requested, login=None):
+    """
+    Downloads the registration history for a quarter and year and updates the 
+    cache, unless another process already refreshed the cache after the 
+    request was made.
+
+    Args:
+        quarter (string):    The academic quarter for the schedule request.
+        year (string):       The academic year for the schedule request.
+        requested (float):   When the caller asked for the schedule.
+        login (tuple):       Optional (netID, password).
+
+    Returns:
+        The raw JSON response text from Banner.
+    """
+    term = app.account_key('_' + year + quarter, login[0] if login else None)
+    cached = app.get_cached(term)
+    if cached and cached.get('fetched', 0) >= requested:
+        return cached['data']
+
+    session, response = get_session(schedule_url(quarter, year), 
+            headers=conditional_headers(cached), login=login, stream=True)
+    return store_schedule(term, cached, response)
+
+def schedule_url(quarter, year):
+    """
+    Builds the Banner registration history url for a quarter and year.
+
+    Args:
+        quarter (string):    The academic quarter.
+        year (string):       The academic year.
+
+    Returns:
+        The url as a string.
+    """
+    return base_url('registration') + '/StudentRegistrationSsb/' + \
             'ssb/registrationHistory/reset?term=' + year + \
             app.encode_quarter(quarter)
 
-    session, response = get_session(sched_url)
+def conditional_headers(cached):
+    """
+    Builds the headers that ask Banner to skip the body if nothing changed 
+    since the cached copy.
+
+    Args:
+        cached (dict):  The cache entry for the request, or None.
+
+    Returns:
+        A dict of request headers.
+    """
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached.get('lastModified'):
+        headers['If-Modified-Since'] = cached['lastModified']
+    return headers
+
+def login_page(url):
+    """
+    Checks if a url is the CAS login page, i.e. where a failed login ends up.
+
+    Args:
+        url (string):   The url to check.
+
+    Returns:
+        True if the url is on the CAS login page.
+    """
+    url = urlparse(str(url))
+    return url.netloc == urlparse(base_url('auth')).netloc and \
+            url.path.startswith('/cas/login')
+
+def store_schedule(key, cached, response):
+    """
+    Checks a registration history response and stores it in the cache.
+
+    Args:
+        key (string):       The cache key for the schedule.
+        cached (dict):      The cache entry before the request, or None.
+        response:           The final response of the login, anything with 
+                            status_code, url, text and headers.
+
+    Returns:
+        The registration JSON as cached, projected to the fields the utils 
+        read.
+
+    Raises:
+        BannerError: if the login failed or Banner sent an error page.
+    """
+    if response.status_code == 304:
+        headers = { 'ETag' : response.headers.get('ETag', cached['etag']), 
+                'Last-Modified' : response.headers.get('Last-Modified', 
+                    cached['lastModified']) }
+        if not app.touch_cached(key, headers):
+            # dropped from the cache since the request was made
+            app.cache_data(key, cached['data'], headers, digest=cached['hash'])
+        return cached['data']
+    if login_page(response.url):
+        raise app.BannerError('CAS login failed, check your credentials')
+
+    # hashes (and with --debug keeps) the full response while only the 
+    # projected courses are held on to
+    digest = hashlib.sha1()
+    raw = [] if app.DEBUG else None
+    def tee(chunk):
+        digest.update(chunk.encode('utf-8'))
+        if raw is not None:
+            raw.append(chunk)
+    try:
+        courses = [app.project_course(course) for course in 
+                app.iter_registrations(response_chunks(response), tee)]
+    except app.BannerError:
+        # an HTML error page from Banner, don't overwrite good cached data
+        record_result(urlparse(str(response.url)).netloc, False)
+        raise BannerUnavailable('Banner returned an error page')
 
     # update cache
-    app.cache_data(term, response.text)
+    data = app.dump_courses(courses)
+    app.cache_data(key, data, response.headers, digest=digest.hexdigest(), 
+            raw=''.join(raw) if raw is not None else None)
+    if not cached or cached.get('hash') != digest.hexdigest():
+        snapshots.record(key, data)
 
-    return response.text
+    return data
 
-def parse_html(html, term):
-    pattern = r'\"(.+?)\"'
-    start = html.find(term)
-    end = html.find('>', start)
-    return re.findall(pattern, html[start:end])
+def response_chunks(response):
+    """
+    Reads the body of a response as text, a chunk at a time.
 
-def find_action(ls):
-    for item in ls:
-        if 'cas' in item:
-            return item
-    return None
+    Args:
+        response:   A requests.Response, or anything with a text.
 
-def find_lt(ls):
-    for item in ls:
-        if 'LT-' in item:
-            return item
-    return None
+    Returns:
+        A generator of strings.
+    """
+    if not hasattr(response, 'iter_content'):
+        yield response.text
+        return
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(
+            errors='replace')
+    for chunk in response.iter_content(app.CHUNK):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+def single_flight(key, fetch):
+    """
+    Runs fetch() once for every caller asking for the same key at the same 
+    time. Threads in this process wait for the caller that got there first 
+    and share its result, other processes wait on a lock file in DATA_DIR.
+
+    Args:
+        key (tuple):        Identifies the request, i.e. (account, term, 
+                            endpoint).
+        fetch (function):   Performs the request and returns its result.
+
+    Returns:
+        Whatever fetch() returned for the caller that performed it.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error:
+            raise flight.error
+        return flight.result
+
+    try:
+        with app.file_lock('flight_' + '_'.join(key)):
+            flight.result = fetch()
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result
 
 def main():
     quarter = app.decode_quarter(app.args['q']).title()
     year = app.args['y']
-    app.parse_response(get_schedule(quarter, year))
+    try:
+        app.parse_response(get_schedule(quarter, year))
+    except app.BannerError as e:
+        print(e)
+        exit(1)
 
 if __name__ == "__main__":
     if app.args['q'] and app.args['y'] and int(app.args['y']) >= 2015 and \
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+    cassette.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Records the requests and responses of a run to a cassette file with
+    --record, and serves them back without any network access with --replay.
+
+    Cassettes are gzipped JSON. Identical response bodies are stored once,
+    and passwords, cookies and CAS tickets are never written.
+"""
+import anti_banner as app
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+try:
+    from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+except ImportError:
+    from urlparse import urlparse, urlunparse, parse_qsl
+    from urllib import urlencode
+
+# query parameters that change on every run and must not affect matching
+VOLATILE_PARAMS = ('ticket', 'lt', 'execution')
+# response headers worth keeping, the rest are noise or secrets
+KEEP_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Location')
+
+# Just enough of a requests.Response for the utils
+Response = namedtuple('Response',
+        ['status_code', 'url', 'text', 'content', 'headers'])
+
+_lock = threading.Lock()
+_tape = None
+
+def cassette_path(name):
+    """
+    Resolves a cassette name, relative names are kept in LOG_DIR.
+    """
+    return name if os.path.isabs(name) else os.path.join(app.LOG_DIR, name)
+
+def recording():
+    return app.args['record'] is not None
+
+def replaying():
+    return app.args['replay'] is not None
+
+def match_key(method, url):
+    """
+    Builds the key recorded responses are matched on.
+
+    Args:
+        method (string):    The HTTP method.
+        url (string):       The requested url.
+
+    Returns:
+        The method and the cleaned url.
+    """
+    return '{} {}'.format(method.upper(), clean_url(url))
+
+def clean_url(url):
+    """
+    Removes session ids and volatile query parameters from a url.
+    """
+    url = urlparse(str(url))
+    path = re.sub(r';jsessionid=[^/?]*', '', url.path)
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(url.query)
+        if k not in VOLATILE_PARAMS))
+    return urlunparse((url.scheme, url.netloc, path, '', query, ''))
+
+def tape():
+    """
+    Loads the cassette being replayed, or starts a new one to record into.
+    """
+    global _tape
+    with _lock:
+        if _tape is None:
+            _tape = { 'bodies' : {}, 'interactions' : {} }
+            if replaying():
+                with gzip.open(cassette_path(app.args['replay']), 'rt') as f:
+                    _tape = json.load(f)
+                _tape['played'] = {}
+            elif recording():
+                atexit.register(save)
+    return _tape
+
+def record(method, url, status, final_url, headers, content):
+    """
+    Adds a response to the cassette being recorded.
+
+    Args:
+        method (string):    The HTTP method of the request.
+        url (string):       The requested url.
+        status (int):       The response status.
+        final_url (string): The url of the response, after redirects.
+        headers (dict):     The response headers.
+        content (bytes):    The response body.
+    """
+    recorded = tape()
+    headers = dict((k.lower(), v) for k, v in headers.items())
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    digest = hashlib.sha1(content).hexdigest()
+    with _lock:
+        recorded['bodies'][digest] = content.decode('utf-8', 'replace')
+        recorded['interactions'].setdefault(match_key(method, url), []) \
+                .append({
+                    'status' : status,
+                    'url' : clean_url(final_url),
+                    'headers' : dict((k, headers[k.lower()]) 
+                        for k in KEEP_HEADERS if k.lower() in headers),
+                    'body' : digest,
+                    })
+
+def play(method, url):
+    """
+    Gets the next recorded response for a request. Once every recording of a
+    request has been played, the last one is repeated.
+
+    Args:
+        method (string):    The HTTP method of the request.
+        url (string):       The requested url.
+
+    Returns:
+        A Response.
+
+    Raises:
+        BannerError: if the request was never recorded.
+    """
+    recorded = tape()
+    key = match_key(method, url)
+    if key not in recorded['interactions']:
+        raise app.BannerError('{} is not in the cassette'.format(key))
+    with _lock:
+        plays = recorded['interactions'][key]
+        played = recorded['played'].get(key, 0)
+        recorded['played'][key] = played + 1
+    entry = plays[min(played, len(plays) - 1)]
+    text = recorded['bodies'][entry['body']]
+    return Response(entry['status'], entry['url'], text,
+            text.encode('utf-8'), entry['headers'])
+
+def save():
+    """
+    Writes the recorded cassette to disk.
+    """
+    with _lock:
+        with gzip.open(cassette_path(app.args['record']), 'wt') as f:
+            json.dump(_tape, f, separators=(',', ':'))
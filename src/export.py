@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+    export.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Anti-Banner Export - Writes a row per course of every cached term of
+    every account to stdout, as JSON lines (--format jsonl, the default) or
+    CSV (--format csv). Terms are read from the cache a batch at a time and
+    written out as they are read, so memory use does not grow with the size
+    of the cache.
+
+    --fields picks the columns, i.e. --fields account,term,crn,grade.
+    --since exports only the terms whose data changed after a watermark.
+    Every export records its start as the next watermark, which --since last
+    picks up, i.e. for a nightly `./export.py --since last > changes.jsonl`.
+"""
+import anti_banner as app
+import csv
+import json
+import os
+import sys
+import time
+from model import load_courses
+
+# every column, in order
+FIELDS = ('account', 'term', 'changed', 'crn', 'subject',
+        'subject_description', 'number', 'section', 'title', 'schedule',
+        'method', 'grade', 'credits', 'instructor', 'instructor_email', 'days',
+        'begin_time', 'end_time', 'start_date', 'end_date', 'building',
+        'building_description', 'room')
+watermark_file = 'export.json'
+
+def load_watermark():
+    try:
+        with open(os.path.join(app.DATA_DIR, watermark_file)) as f:
+            return json.load(f)['watermark']
+    except (IOError, ValueError, KeyError):
+        return None
+
+def save_watermark(watermark):
+    path = os.path.join(app.DATA_DIR, watermark_file)
+    with app.file_lock('export'):
+        with open(path + '.tmp', 'w') as f:
+            json.dump({ 'watermark' : watermark }, f)
+        os.replace(path + '.tmp', path)
+
+def get_fields():
+    """
+    Gets the columns picked with --fields.
+
+    Raises:
+        ValueError: if a field does not exist.
+    """
+    if not app.args['fields']:
+        return FIELDS
+    fields = tuple(field.strip() for field in app.args['fields'].split(','))
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError('Unknown fields: {}. Pick from {}.'.format(
+            ', '.join(unknown), ', '.join(FIELDS)))
+    return fields
+
+def get_since():
+    """
+    Gets the watermark given with --since, or None to export everything.
+    """
+    since = app.args['since']
+    if since == 'last':
+        return load_watermark()
+    return float(since) if since else None
+
+def course_row(account, term, changed, course):
+    """
+    Flattens a course into a row, with its main meeting time.
+    """
+    row = { 'account' : account, 'term' : term, 'changed' : changed }
+    row.update((name, getattr(course, name)) for name in ('crn', 'subject',
+        'subject_description', 'number', 'section', 'title', 'schedule',
+        'method', 'grade', 'credits', 'instructor', 'instructor_email'))
+    times = course.meeting.as_dict() if course.meeting else {}
+    row['days'] = ','.join(course.meeting.day_codes()) if course.meeting \
+            else ''
+    row.update((name, times.get(name, '')) for name in ('begin_time',
+        'end_time', 'start_date', 'end_date', 'building',
+        'building_description', 'room'))
+    return row
+
+def rows(since=None):
+    """
+    Reads the cache one term at a time.
+
+    Args:
+        since (float):  Optional watermark, terms whose data did not change
+                        after it are skipped.
+
+    Returns:
+        A generator of rows as dicts, one per course.
+    """
+    default = app.get_config('netID')
+    index = app.cache_index()
+    keys = [key for key in sorted(index) if since is None or
+            (index[key]['changed'] or 0) > since]
+    for key, entry in app.iter_cached(keys):
+        try:
+            courses = load_courses(entry['data'])
+        except (ValueError, KeyError, TypeError):
+            # not registration data, i.e. an old error response
+            continue
+        account, term = app.split_key(key)
+        for course in courses:
+            yield course_row(account or default, term,
+                    index[key]['changed'], course)
+
+def export(out, fields, since=None):
+    """
+    Writes rows to a file as JSON lines or CSV, per --format.
+
+    Returns:
+        The number of rows written.
+    """
+    count = 0
+    if app.args['format'] == 'csv':
+        writer = csv.DictWriter(out, fields, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows(since):
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows(since):
+            out.write(json.dumps(dict((field, row[field])
+                for field in fields)) + '\n')
+            count += 1
+    return count
+
+def main():
+    start = time.time()
+    try:
+        count = export(sys.stdout, get_fields(), get_since())
+        # the last rows may still be buffered, the watermark only moves on 
+        # once every row went out
+        sys.stdout.flush()
+    except ValueError as e:
+        sys.stderr.write('{}\n'.format(e))
+        exit(1)
+    except (IOError, OSError) as e:
+        # i.e. a broken pipe, stdout can't be flushed again at exit either
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.stderr.write('Export cut short, watermark not saved: {}\n'
+                .format(e))
+        exit(1)
+    save_watermark(start)
+    if not app.SILENT:
+        sys.stderr.write('Exported {} rows, watermark {}\n'.format(count,
+            start))
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print('\nBye Felicia!')
@@ -10,7 +10,8 @@
 import anti_banner as app
 import grades
 from lxml import html
-from banner_connect import get_session
+from model import Course
+from banner_connect import get_session, fetch, base_url
 
 app_name = 'Final Grades Fetcher'
 version = '1.0'
@@ -30,14 +31,33 @@ def get_final_grades(quarter, year):
     Examples:
         >>> get_final_grades('spring','2017')
     """
-    login_url = 'https://bannersso.ucr.edu:443/ssomanager/c/SSB'
-    grades_url = 'https://banweb.ucr.edu/banprod/bwskogrd.P_ViewGrde' + \
-            '?term_in=' + year + app.encode_quarter(quarter)
-
-    session, response = get_session(login_url)
-    response = session.get(grades_url)
+    session, response = get_session(login_url())
+    response = fetch(session, 'GET', grades_url(quarter, year))
     return extract_course_info(response.content)
 
+def login_url():
+    """
+    Gets the Banner SSO url that logs in to RWeb.
+
+    Returns:
+        The url as a string.
+    """
+    return base_url('sso') + '/ssomanager/c/SSB'
+
+def grades_url(quarter, year):
+    """
+    Builds the RWeb final grades url for a quarter and year.
+
+    Args:
+        quarter (string):    The academic quarter.
+        year (string):       The academic year.
+
+    Returns:
+        The url as a string.
+    """
+    return base_url('rweb') + '/banprod/bwskogrd.P_ViewGrde' + \
+            '?term_in=' + year + app.encode_quarter(quarter)
+
 def extract_course_info(content):
     """
     Parses a requests.response.content object for a grade data. The parsing 
@@ -48,22 +68,20 @@ def extract_course_info(content):
         content (requests.response.content):    The HTML content to parse.
 
     Returns:
-        A list of courses, with structured course data available from the 
-        parse.
+        A list of Course, with the course data available from the parse.
     """
     courses = []
-    tree = html.fromstring(content)
+    with app.tracing.span('html.parse', size=len(content)):
+        tree = html.fromstring(content)
     # table[5] has grades
     course_table = tree.xpath('//table')[5]
     for i, data in enumerate(course_table[2:]):
-        course = {}
-        course['courseReferenceNumber'] = data[0].text.replace('\n', '')
-        course['subject'] = data[1].text.replace('\n', '')
-        course['courseNumber'] = data[2].text .replace('\n', '')
-        course['sequenceNumber'] = data[3].text.replace('\n', '')
-        course['courseTitle'] = data[4].text.replace('\n', '')
-        course['grade'] = data[6].text.replace('\n', '')
-        courses.append(course)
+        courses.append(Course(crn=data[0].text.replace('\n', ''), 
+            subject=data[1].text.replace('\n', ''), 
+            number=data[2].text.replace('\n', ''), 
+            section=data[3].text.replace('\n', ''), 
+            title=data[4].text.replace('\n', ''), 
+            grade=data[6].text.replace('\n', '')))
     return courses
 
 def main():
@@ -86,6 +104,9 @@ def main():
             print('Oops, there is nothing available for {} {}!'.format(
                 app.decode_quarter(quarter), year
                 ))
+    except app.BannerError as e:
+        print(e)
+        exit(1)
     # Catch a ctrl+c interrupt and print an exit message
     except KeyboardInterrupt:
         print('\nBye Felicia!')
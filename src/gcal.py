@@ -9,6 +9,8 @@ from oauth2client import tools
 from oauth2client.file import Storage
 from anti_banner import parser
 from anti_banner import PROJ_ROOT
+import cassette
+import tracing
 
 try:
     import argparse
@@ -61,10 +63,61 @@ def get_credentials():
         print('Storing credentials to ' + credential_path)
     return credentials
 
+class CassetteHttp(object):
+    """
+    Wraps an httplib2.Http to record its responses with --record, or stands 
+    in for it with --replay.
+    """
+
+    def __init__(self, http=None):
+        self.http = http
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if cassette.replaying():
+            response = cassette.play(method, uri)
+            info = dict(response.headers)
+            info['status'] = str(response.status_code)
+            return (httplib2.Response(info), response.content)
+
+        response, content = self.http.request(uri, method=method, body=body, 
+                headers=headers, **kwargs)
+        cassette.record(method, uri, response.status, 
+                response.get('content-location', uri), response, content)
+        return (response, content)
+
+_service = None
+
 def auth():
-    credentials = get_credentials()
-    http = credentials.authorize(httplib2.Http())
-    return discovery.build('calendar', 'v3', http=http)
+    """
+    Gets the Calendar API service, built once per process.
+    """
+    global _service
+    if _service is not None:
+        return _service
+    with tracing.span('gcal.auth'):
+        if cassette.replaying():
+            _service = discovery.build('calendar', 'v3', http=CassetteHttp())
+            return _service
+        credentials = get_credentials()
+        http = credentials.authorize(httplib2.Http())
+        if cassette.recording():
+            http = CassetteHttp(http)
+        _service = discovery.build('calendar', 'v3', http=http)
+        return _service
+
+def execute(request, op):
+    """
+    Executes a Calendar API request, timed as a tracing span.
+
+    Args:
+        request:        The API request, i.e. service.events().insert(...)
+        op (string):    The name of the call, i.e. 'events.insert'
+    """
+    with tracing.span('gcal.' + op):
+        return request.execute()
 
 def get_calendar_list():
     calendar_list = {}
@@ -72,8 +125,8 @@ def get_calendar_list():
 
     page_token = None
     while True:
-        calendar_list = service.calendarList().list(
-                pageToken=page_token).execute()
+        calendar_list = execute(service.calendarList().list(
+                pageToken=page_token), 'calendarList.list')
         page_token = calendar_list.get('nextPageToken')
         if not page_token:
             break
@@ -93,7 +146,8 @@ def calendar_exists(calendar, calendarList):
 
 def delete_calendar(calendar):
     service = auth()
-    return service.calendars().delete(calendarId=calendar).execute()
+    return execute(service.calendars().delete(calendarId=calendar), 
+            'calendars.delete')
 
 def create_calendar(calendar, calendarList):
     service = auth()
@@ -102,11 +156,27 @@ def create_calendar(calendar, calendarList):
             'summary' : calendar,
             }
 
-    return service.calendars().insert(body=new_calendar).execute()
+    return execute(service.calendars().insert(body=new_calendar), 
+            'calendars.insert')
 
 def create_calendar_event(calendar, event):
     service = auth()
-    return service.events().insert(calendarId=calendar, body=event).execute()
+    return execute(service.events().insert(calendarId=calendar, body=event), 
+            'events.insert')
+
+def patch_calendar_event(calendar, event, body):
+    """
+    Updates the given fields of a calendar event, leaving the rest as is.
+
+    Args:
+        calendar (string):  the id of the calendar the event is on
+        event (string):     the id of the event to update
+        body (dict):        the fields to change
+    """
+
+    service = auth()
+    return execute(service.events().patch(calendarId=calendar, eventId=event, 
+        body=body), 'events.patch')
 
 def delete_calendar_event(calendar, event):
     """
@@ -118,7 +188,8 @@ def delete_calendar_event(calendar, event):
     """
 
     service = auth()
-    return service.events().delete(calendarId=calendar, eventId=event).execute()
+    return execute(service.events().delete(calendarId=calendar, 
+        eventId=event), 'events.delete')
 
 # TODO: test this...
 def get_events_by_day(calendar, stopDay):
@@ -146,9 +217,10 @@ def get_events_by_day(calendar, stopDay):
     #     if not page_token:
     #         break
     # return events
-    return service.events().list(calendarId=calendar, timeMax=stopDay).execute()
+    return execute(service.events().list(calendarId=calendar, 
+        timeMax=stopDay), 'events.list')
 
 def get_event_instances(calendar, event):
     service = auth()
-    return service.events().instances(calendarId=calendar, 
-            eventId=event).execute()
+    return execute(service.events().instances(calendarId=calendar, 
+            eventId=event), 'events.instances')
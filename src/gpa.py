@@ -10,11 +10,14 @@
 import sys
 import json
 import anti_banner as app
-from banner_connect import get_session
+from banner_connect import get_session, fetch, base_url
 
 app_name = 'GPA Fetcher'
 version = '1.0'
 
+# the last GPA fetched for each sid in this process
+_gpa = {}
+
 def sid_from_cred():
     """
     Gets SID from credentials.json file.
@@ -32,14 +35,15 @@ def sid_from_cred():
     else:
         return None
 
-def get_gpa(sid=sid_from_cred(), session=get_session()[0]):
+def get_gpa(sid=sid_from_cred(), session=None):
     """
     Connects to RWeb and requests the overall GPA a for a particular sid.
 
     Args:
         sid (string):               The student id to retreive the GPA for.
         session (requests.Session)  An optional requests.Session that has 
-                                    already been authenticated.
+                                    already been authenticated. A new one is 
+                                    created if none is given.
 
     Returns:
         The overall GPA as a string if the SID is valid and the user is 
@@ -50,14 +54,51 @@ def get_gpa(sid=sid_from_cred(), session=get_session()[0]):
     """
     if sid is None:
         return None
-    profile_url = 'https://studentssb.ucr.edu/StudentSelfService/ssb/studentProfile'
     gpa_endpoint = '/viewGPAHoursList?studentId=' + sid
 
+    if session is None:
+        session = get_session()[0]
+
     # need to load student profile first before API is active
-    response = session.get(profile_url)
-    response = session.get(profile_url+gpa_endpoint)
+    response = fetch(session, 'GET', profile_url())
+    response = fetch(session, 'GET', profile_url()+gpa_endpoint)
+    _gpa[sid] = parse_gpa(response.text)
+    return _gpa[sid]
+
+def cached_gpa(sid=sid_from_cred()):
+    """
+    Gets the GPA last fetched by get_gpa() in this process, without any 
+    requests.
+
+    Args:
+        sid (string):   The student id.
+
+    Returns:
+        The overall GPA as a string, or None if it was not fetched yet.
+    """
+    return _gpa.get(sid)
+
+def profile_url():
+    """
+    Gets the url of the RWeb student profile.
+
+    Returns:
+        The url as a string.
+    """
+    return base_url('profile') + '/StudentSelfService/ssb/studentProfile'
+
+def parse_gpa(text):
+    """
+    Gets the overall GPA from a viewGPAHoursList response.
+
+    Args:
+        text (string):  The JSON response text.
+
+    Returns:
+        The overall GPA as a string, or None if it is not in the response.
+    """
     try:
-        gpa = json.loads(response.text)['overallGpa']
+        gpa = json.loads(text)['overallGpa']
     except:
         gpa = None
     return gpa
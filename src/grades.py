@@ -10,7 +10,8 @@
 """
 import anti_banner as app
 import final_grades
-from gpa import get_gpa
+from gpa import get_gpa, cached_gpa
+from model import load_courses
 from sys import exit
 from banner_connect import get_schedule
 
@@ -23,27 +24,26 @@ def print_course_grade_info(course):
     Prints all of the relevant info for a course.
 
     Args:
-        course (dict):  A dict of all the course info returned from a single 
-                        entry of the JSON output of get_schedule()
+        course (Course):    The course to print.
     """
 
-    print('Course: {} {} - {}'.format(course['subject'], 
-        course['courseNumber'], course['courseTitle'].title()))
-    print('Grade: {}\n'.format(course['grade']))
+    print('Course: {} {} - {}'.format(course.subject, course.number, 
+        course.title.title()))
+    print('Grade: {}\n'.format(course.grade))
 
 def print_grades(courses):
     """
     Prints course info including grades for a list of courses.
 
     Args:
-        courses (list): A list of courses containing structured course data.
+        courses (list): A list of Course.
 
     Returns:
         True if there is at least one grade to print, otherwise False.
     """
     grades = None
-    for course in sorted(courses, key=lambda k: k['courseTitle']):
-        if course['grade']:
+    for course in sorted(courses, key=lambda k: k.title):
+        if course.grade:
             if grades == None:
                 print('\n{} Available Grades:'.format(class_schedule))
 
@@ -67,6 +67,9 @@ def main():
         if app.CACHED:
             cache = app.get_cached(term)
             print('Grades as of {}'.format(cache['dumpDate']))
+            gpa = cached_gpa()
+            if gpa:
+                print('Current Overall GPA: {}'.format(gpa))
 
         else:
             print('Checking Banner Registration Data...')
@@ -75,8 +78,7 @@ def main():
                 print('Current Overall GPA: {}'.format(gpa))
             get_schedule(quarter, year)
 
-        cached_data = app.json.loads(app.get_cached(term)['data'])
-        courses = cached_data['data']['registrations']
+        courses = load_courses(app.get_cached(term)['data'])
 
         # Check that we have received something worthwhile
         if len(courses) > 0:
@@ -97,6 +99,9 @@ def main():
                 print('All Done!')
             else:
                 print('Sorry, nothing there either.')
+    except app.BannerError as e:
+        print(e)
+        exit(1)
     # Catch a ctrl+c interrupt and print an exit message
     except KeyboardInterrupt:
         print('\nBye Felicia!')
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+    leases.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Time-bounded leases and notification records in an SQLite database, so
+    several pollers (processes on one host, or hosts sharing a disk) can
+    split the accounts between them and send each change once.
+
+    A change is only recorded as notified once every sink confirmed it.
+    Until then its claim expires like a lease, and the next poll of the term
+    by any worker sends it again to the sinks that don't have it yet.
+
+    The database is DATA_DIR/leases.db, or the "lease_db" path in
+    credentials.json, i.e. on an NFS mount every node can write to.
+"""
+import anti_banner as app
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+db_file = 'leases.db'
+# seconds a lease or a worker heartbeat lasts without being renewed
+LEASE_TTL = 180
+
+_local = threading.local()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS leases (
+    resource TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notifications (
+    account TEXT NOT NULL,
+    term TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    expires REAL NOT NULL,
+    event TEXT NOT NULL,
+    delivered TEXT NOT NULL,
+    done INTEGER NOT NULL,
+    PRIMARY KEY (account, term)
+);
+'''
+
+def worker_id():
+    """
+    Identifies this process across every node, i.e. 'node1:4242'.
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+def connect():
+    """
+    Gets this thread's connection to the lease database, creating the
+    tables on first use.
+    """
+    db = getattr(_local, 'db', None)
+    if db is None:
+        path = app.get_config('lease_db', os.path.join(app.DATA_DIR, db_file))
+        # autocommit, transactions are started explicitly
+        db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        db.executescript(SCHEMA)
+        _local.db = db
+    return db
+
+@contextmanager
+def transaction():
+    """
+    Runs a with block as one write transaction. The database write lock is 
+    taken up front, so a read followed by a write is atomic.
+    """
+    db = connect()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+def acquire(resource, ttl=LEASE_TTL):
+    """
+    Takes or renews the lease of a resource for this worker.
+
+    Args:
+        resource (string):  What the lease is for, i.e. an account.
+        ttl (float):        Seconds until the lease expires.
+
+    Returns:
+        True if this worker holds the lease.
+    """
+    now = time.time()
+    with transaction() as db:
+        row = db.execute('SELECT owner, expires FROM leases WHERE '
+                'resource = ?', (resource,)).fetchone()
+        if row and row[0] != worker_id() and row[1] > now:
+            return False
+        db.execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?)',
+                (resource, worker_id(), now + ttl))
+    return True
+
+def release(resource):
+    """
+    Gives up the lease of a resource, if this worker holds it.
+    """
+    with transaction() as db:
+        db.execute('DELETE FROM leases WHERE resource = ? AND owner = ?',
+                (resource, worker_id()))
+
+def held():
+    """
+    Gets the resources this worker holds an unexpired lease on.
+    """
+    return set(row[0] for row in connect().execute('SELECT resource FROM '
+        'leases WHERE owner = ? AND expires > ?', (worker_id(), time.time())))
+
+def heartbeat(ttl=LEASE_TTL):
+    """
+    Marks this worker as alive and forgets workers that stopped.
+
+    Returns:
+        The number of live workers, this one included.
+    """
+    now = time.time()
+    with transaction() as db:
+        db.execute('INSERT OR REPLACE INTO workers VALUES (?, ?)',
+                (worker_id(), now + ttl))
+        db.execute('DELETE FROM workers WHERE expires <= ?', (now,))
+        return db.execute('SELECT COUNT(*) FROM workers').fetchone()[0]
+
+def retire():
+    """
+    Removes this worker and its leases, so others take over right away.
+    """
+    with transaction() as db:
+        db.execute('DELETE FROM workers WHERE worker = ?', (worker_id(),))
+        db.execute('DELETE FROM leases WHERE owner = ?', (worker_id(),))
+
+def claim_notification(account, term, digest, event=None, ttl=LEASE_TTL):
+    """
+    Claims sending a change of a term for ttl seconds. Only one worker at a
+    time gets to send a given state of a term, and once every sink confirmed
+    it (see confirm_delivery()) nobody does.
+
+    Args:
+        account (string):   The netID.
+        term (string):      The term, i.e. '_2017Spring'.
+        digest (string):    The hash of the new registration data.
+        event (dict):       The change event, kept to send again if it is
+                            not confirmed. Without it, only an unconfirmed
+                            event of digest whose claim expired is claimed.
+        ttl (float):        Seconds before an unconfirmed event is sent
+                            again.
+
+    Returns:
+        A tuple of the event and the names of the sinks that already have
+        it, or None if this worker has nothing to send.
+    """
+    now = time.time()
+    with transaction() as db:
+        row = db.execute('SELECT hash, expires, event, delivered, done FROM '
+                'notifications WHERE account = ? AND term = ?',
+                (account, term)).fetchone()
+        if row and row[0] == digest:
+            if row[4] or row[1] > now:
+                # sent, or being sent by a worker
+                return None
+            db.execute('UPDATE notifications SET worker = ?, expires = ? '
+                    'WHERE account = ? AND term = ?',
+                    (worker_id(), now + ttl, account, term))
+            return (json.loads(row[2]), json.loads(row[3]))
+        if event is None:
+            return None
+        db.execute('INSERT OR REPLACE INTO notifications VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?)', (account, term, digest,
+                    worker_id(), now + ttl, json.dumps(event), '[]', 0))
+    return (event, [])
+
+def confirm_delivery(account, term, digest, sink, sinks):
+    """
+    Records that a sink sent a change, and the change as notified once all
+    sinks did.
+
+    Args:
+        account (string):   The netID.
+        term (string):      The term, i.e. '_2017Spring'.
+        digest (string):    The hash of the registration data sent.
+        sink (string):      The name of the sink that sent it.
+        sinks (list):       The names of every sink.
+    """
+    with transaction() as db:
+        row = db.execute('SELECT delivered FROM notifications WHERE '
+                'account = ? AND term = ? AND hash = ?',
+                (account, term, digest)).fetchone()
+        if row is None:
+            # a newer change replaced it
+            return
+        delivered = sorted(set(json.loads(row[0])) | set([sink]))
+        db.execute('UPDATE notifications SET delivered = ?, done = ? WHERE '
+                'account = ? AND term = ?', (json.dumps(delivered),
+                    int(set(sinks) <= set(delivered)), account, term))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+    logs.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Structured (JSON lines) logs in LOG_DIR with buffered writes and
+    rotation. Rotated segments are gzipped, and repeated "nothing new" ticks
+    of an account and term are collapsed so log I/O stays flat over long
+    deployments. Buffered records are written at least every
+    FLUSH_INTERVAL seconds.
+
+    Rotation can be tuned in credentials.json with "log_max_bytes",
+    "log_backups" and "log_when" (i.e. "midnight" to rotate daily instead of
+    by size).
+"""
+import anti_banner as app
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import shutil
+import threading
+import time
+
+MAX_BYTES = 1024 * 1024
+BACKUPS = 5
+BUFFER = 50
+# seconds a buffered record waits at most before it is written
+FLUSH_INTERVAL = 5
+# write one "nothing new" tick out of this many
+QUIET_EVERY = 100
+state_file = 'log_state.json'
+
+_loggers = {}
+_handlers = []
+# quiet streaks, loaded from state_file once and saved when they matter
+_streaks = None
+_dirty = set()
+_streak_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+                'ts' : time.strftime('%Y-%m-%dT%H:%M:%S',
+                    time.localtime(record.created)),
+                'level' : record.levelname.lower(),
+                'msg' : record.getMessage(),
+                }
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, sort_keys=True)
+
+class SharedFileHandler(object):
+    """
+    Makes a rotating file handler safe to share between processes: records
+    are written under a lock in DATA_DIR, and the file is reopened if
+    another process rotated it.
+    """
+
+    def emit(self, record):
+        with app.file_lock('log_' + os.path.basename(self.baseFilename)):
+            if self.stream and (not os.path.exists(self.baseFilename) or
+                    os.stat(self.baseFilename).st_ino !=
+                    os.fstat(self.stream.fileno()).st_ino):
+                self.stream.close()
+                self.stream = None
+            super(SharedFileHandler, self).emit(record)
+
+class SizeRotatingHandler(SharedFileHandler,
+        logging.handlers.RotatingFileHandler):
+    pass
+
+class TimeRotatingHandler(SharedFileHandler,
+        logging.handlers.TimedRotatingFileHandler):
+    pass
+
+def gzip_namer(name):
+    return name + '.gz'
+
+def gzip_rotator(source, dest):
+    """
+    Compresses a rotated log segment.
+    """
+    with open(source, 'rb') as log, gzip.open(dest, 'wb') as compressed:
+        shutil.copyfileobj(log, compressed)
+    os.remove(source)
+
+def get_logger(name):
+    """
+    Gets a structured logger writing to LOG_DIR/<name>.log.
+
+    Args:
+        name (string):  The log name, i.e. 'changes'.
+
+    Returns:
+        A logging.Logger. Pass fields with extra={'fields' : {...}}, or use
+        log_event().
+    """
+    if name in _loggers:
+        return _loggers[name]
+
+    path = os.path.join(app.LOG_DIR, '{}.log'.format(name))
+    backups = app.get_config('log_backups', BACKUPS)
+    if app.get_config('log_when'):
+        handler = TimeRotatingHandler(path, when=app.get_config('log_when'),
+                backupCount=backups, delay=True)
+    else:
+        handler = SizeRotatingHandler(path, maxBytes=app.get_config(
+            'log_max_bytes', MAX_BYTES), backupCount=backups, delay=True)
+    handler.namer = gzip_namer
+    handler.rotator = gzip_rotator
+    handler.setFormatter(JsonFormatter())
+
+    logger = logging.getLogger('anti_banner.' + name)
+    logger.setLevel(logging.DEBUG if app.DEBUG else logging.INFO)
+    logger.propagate = False
+    # records are held until BUFFER have queued up, an error is logged,
+    # FLUSH_INTERVAL passes or the process exits (logging.shutdown flushes)
+    buffered = logging.handlers.MemoryHandler(BUFFER,
+        flushLevel=logging.ERROR, target=handler)
+    logger.addHandler(buffered)
+    if not _handlers:
+        threading.Thread(target=_flush_every, name='log-flush',
+                daemon=True).start()
+    _handlers.append(buffered)
+    _loggers[name] = logger
+    return logger
+
+def _flush_every():
+    """
+    Writes out the buffered records of every log every FLUSH_INTERVAL
+    seconds, so a quiet process doesn't hold them indefinitely.
+    """
+    interval = app.get_config('log_flush_interval', FLUSH_INTERVAL)
+    while True:
+        time.sleep(interval)
+        for handler in list(_handlers):
+            handler.flush()
+
+def log_event(name, msg, level=logging.INFO, **fields):
+    """
+    Writes a structured log entry, and resets the quiet streak of its
+    account and term.
+
+    Args:
+        name (string):  The log name, i.e. 'changes'.
+        msg (string):   The event, i.e. 'New changes'.
+        level (int):    The logging level.
+        fields:         Extra fields for the entry, i.e. term='_2017Spring'.
+    """
+    _quiet_streak(_streak_key(name, fields), reset=True)
+    get_logger(name).log(level, msg, extra={ 'fields' : fields })
+
+def log_quiet(name, msg, **fields):
+    """
+    Logs a routine tick, i.e. a poll with nothing new. Only the first tick
+    after an event and then one out of every QUIET_EVERY are written, with
+    the number of ticks they stand for. Streaks are kept per account and
+    term, from the account and term fields.
+
+    Args:
+        name (string):  The log name.
+        msg (string):   The tick message.
+        fields:         Extra fields for the entry.
+    """
+    count = _quiet_streak(_streak_key(name, fields))
+    if (count - 1) % QUIET_EVERY == 0:
+        # the first tick stands for itself, later ones for every tick since
+        # the last one written
+        fields['repeated'] = 1 if count == 1 else QUIET_EVERY
+        get_logger(name).info(msg, extra={ 'fields' : fields })
+        _save_streaks()
+
+def _streak_key(name, fields):
+    return '{}:{}:{}'.format(name, fields.get('account', ''),
+            fields.get('term', ''))
+
+def _quiet_streak(key, reset=False):
+    """
+    Counts quiet ticks in a row. Counts are kept in memory and carried over
+    to the next process through state_file, which is only read once and
+    written when a streak is reset, a tick is written or the process exits.
+    """
+    global _streaks
+    with _streak_lock:
+        if _streaks is None:
+            _streaks = _load_streaks()
+            atexit.register(_save_streaks)
+        count = 0 if reset else _streaks.get(key, 0) + 1
+        if _streaks.get(key, 0) == count:
+            return count
+        _streaks[key] = count
+        _dirty.add(key)
+    if reset:
+        _save_streaks()
+    return count
+
+def _load_streaks():
+    with app.file_lock('log_state', shared=True):
+        return _load_state(os.path.join(app.DATA_DIR, state_file))
+
+def _save_streaks():
+    """
+    Writes this process's changed streaks into state_file, keeping the
+    other processes' streaks.
+    """
+    with _streak_lock:
+        changed = dict((key, _streaks[key]) for key in _dirty)
+        _dirty.clear()
+    if not changed:
+        return
+    path = os.path.join(app.DATA_DIR, state_file)
+    with app.file_lock('log_state'):
+        state = _load_state(path)
+        state.update(changed)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+def _load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
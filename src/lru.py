@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+    lru.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    A bounded, thread safe least-recently-used map, used to keep cache
+    entries in memory between reads of the same term.
+"""
+import threading
+from collections import OrderedDict
+
+class LRU(object):
+    """
+    Keeps at most max_entries values, and at most max_bytes in total as
+    measured by sizeof, evicting the least recently used first.
+
+    Examples:
+        >>> memory = LRU(2, 1024, sizeof=len)
+        >>> memory.put('a', 'spam')
+        >>> memory.get('a')
+        'spam'
+    """
+
+    def __init__(self, max_entries, max_bytes, sizeof=lambda value: 1):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Gets a value and marks it as recently used.
+
+        Returns:
+            The value, or None if it is not kept.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        """
+        Keeps a value, evicting old ones to stay within the limits. Values
+        bigger than max_bytes on their own are not kept.
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or \
+                    self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, key=None):
+        """
+        Drops one value, or every value if no key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self.size = 0
+            else:
+                self._discard(key)
+
+    def stats(self):
+        """
+        Gets the hit and miss counts and the current size.
+
+        Returns:
+            A dict with hits, misses, entries and bytes.
+        """
+        with self._lock:
+            return { 'hits' : self.hits, 'misses' : self.misses,
+                    'entries' : len(self._entries), 'bytes' : self.size }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.size -= entry[1]
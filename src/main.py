@@ -5,8 +5,13 @@
     Date created: 2017/04/04
     Python Version 3.5.2
 
-    Simple menu interface for anti-banner functions
+    Simple menu interface for anti-banner functions. The menu keeps running
+    until you quit, and keeps what it already fetched: after the first
+    command for a quarter, later commands for it are served from memory
+    without logging in again.
 """
+import anti_banner as app
+import metrics
 from anti_banner import print_greeting
 from anti_banner import args
 from grades import main as grades
@@ -14,31 +19,67 @@ from add_to_gcal import main as gcal
 from sys import exit
 
 options = [
-        'Check grades', 
-        'Add schedule to Google Calendar'
+        'Check grades',
+        'Add schedule to Google Calendar',
+        'Change quarter/year',
+        'Quit'
         ]
 
+# quarters fetched from Banner since the menu was started
+fetched = set()
+
+def change_term():
+    """
+    Prompts for a new quarter and year, which the next commands use.
+    """
+    args['q'] = None
+    args['y'] = None
+    args['q'], args['y'] = app.get_user_input()
+
+def run(command):
+    """
+    Runs a command for the current quarter and year. The first run for a
+    quarter fetches from Banner, later runs use the data already fetched.
+
+    Args:
+        command (function): The main() of a util.
+    """
+    term = (app.decode_quarter(args['q']), args['y'])
+    app.CACHED = args['cached'] or term in fetched
+    try:
+        command()
+        fetched.add(term)
+    except SystemExit:
+        # the util gave up on this command, keep the menu running
+        pass
+    finally:
+        app.CACHED = args['cached']
+        metrics.flush()
+
 def main():
     print_greeting('', '1.5')
 
     while True:
-        print('Select an option:\n')
+        print('\n{} {} - select an option:\n'.format(
+            app.decode_quarter(args['q']), args['y']))
         for i, option in enumerate(options):
             print('  {}. {}'.format(i+1, option))
         print('  ')
         try:
-            sel = input()
-        except KeyboardInterrupt:
+            sel = input().strip()
+        except (KeyboardInterrupt, EOFError):
             print('\nBye Felicia!')
             quit()
 
-        if int(sel) >= 1 and int(sel) <= len(options):
+        if sel == '1':
+            run(grades)
+        elif sel == '2':
+            run(gcal)
+        elif sel == '3':
+            change_term()
+        elif sel == '4' or sel.lower() == 'q':
+            print('Bye Felicia!')
             break
-    
-    if sel == '1':
-        grades()
-    elif sel == '2':
-        gcal()
 
 if __name__ == "__main__":
     if args['q'] is None or args['y'] is None:
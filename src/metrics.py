@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+    metrics.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Operational metrics for the change poller. Every process adds its counts
+    to a shared state file in DATA_DIR at exit and rewrites metrics.prom, a
+    Prometheus text file (point node_exporter's textfile collector at it, or
+    set "metrics_file" in credentials.json). Long-running processes also
+    flush while they run, every round or every "metrics_interval" seconds.
+
+    Run this file to serve the metrics over HTTP instead.
+
+    Example: `./metrics.py --port 9410`
+"""
+import anti_banner as app
+import atexit
+import json
+import os
+import threading
+import time
+
+state_file = 'metrics.json'
+prom_file = 'metrics.prom'
+PREFIX = 'anti_banner_'
+# seconds between flushes of a long-running process
+FLUSH_INTERVAL = 60
+
+# name : (type, help)
+METRICS = {
+        'polls_total' : ('counter', 'Change polls run.'),
+        'polls_skipped_total' : ('counter', 
+            'Change polls skipped by the polling plan.'),
+        'last_poll_timestamp_seconds' : ('gauge',
+            'When the last change poll finished.'),
+        'logins_total' : ('counter', 'CAS logins submitted.'),
+        'logins_skipped_total' : ('counter', 
+            'Logins skipped because the last session was still good.'),
+        'cache_hits_total' : ('counter', 'Cache reads that found data.'),
+        'cache_misses_total' : ('counter', 'Cache reads that found nothing.'),
+        'memory_cache_hits_total' : ('counter', 
+            'Cache reads served from memory.'),
+        'memory_cache_misses_total' : ('counter', 
+            'Cache reads that had to go to disk.'),
+        'changes_total' : ('counter', 'Registration changes detected.'),
+        'notifications_total' : ('counter', 'Notifications sent.'),
+        'notification_failures_total' : ('counter',
+            'Notifications that failed or were rejected.'),
+        'notification_seconds' : ('summary', 'Time taken to notify.'),
+        'sink_dropped_total' : ('counter', 
+            'Change events dropped because a sink fell behind.'),
+        'banner_errors_total' : ('counter',
+            'Polls that got no usable data from Banner.'),
+        'request_failures_total' : ('counter',
+            'Requests that failed after every retry.'),
+        }
+
+_lock = threading.Lock()
+_pending = {}
+_registered = []
+
+def _register():
+    if not _registered:
+        atexit.register(flush)
+        _registered.append(True)
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def inc(name, value=1, **labels):
+    """
+    Adds to a counter.
+
+    Args:
+        name (string):  One of the METRICS, i.e. 'polls_total'.
+        value (number): How much to add.
+        labels:         Labels for the series, i.e. account='jdoe001'.
+    """
+    with _lock:
+        _register()
+        key = _key(name, labels)
+        _pending[key] = _pending.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """
+    Sets a gauge.
+    """
+    with _lock:
+        _register()
+        _pending[_key(name, labels)] = ('set', value)
+
+def observe(name, seconds, **labels):
+    """
+    Records one observation of a summary, i.e. a latency.
+    """
+    inc(name + '_sum', seconds, **labels)
+    inc(name + '_count', 1, **labels)
+
+def flush():
+    """
+    Merges this process's metrics into the shared state and rewrites the
+    Prometheus text file.
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+
+    with app.file_lock('metrics'):
+        state = load_state()
+        for (name, labels), value in pending.items():
+            series = state.setdefault(name, {})
+            label_key = json.dumps(dict(labels), sort_keys=True)
+            if isinstance(value, tuple):
+                series[label_key] = value[1]
+            else:
+                series[label_key] = series.get(label_key, 0) + value
+        # replaced whole, a torn write would reset every counter
+        state_path = os.path.join(app.DATA_DIR, state_file)
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(state_path + '.tmp', state_path)
+
+        path = app.get_config('metrics_file',
+                os.path.join(app.DATA_DIR, prom_file))
+        with open(path + '.tmp', 'w') as f:
+            f.write(render(state))
+        os.replace(path + '.tmp', path)
+
+def flush_every(interval=None):
+    """
+    Flushes in a background thread every interval seconds, for processes
+    that run until they are stopped.
+
+    Args:
+        interval (float):   Seconds between flushes, defaults to
+                            "metrics_interval" or FLUSH_INTERVAL.
+    """
+    interval = interval or app.get_config('metrics_interval', FLUSH_INTERVAL)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+def load_state():
+    """
+    Loads the shared metric state from DATA_DIR.
+
+    Returns:
+        A dict of metric name to {labels JSON : value}.
+    """
+    try:
+        with open(os.path.join(app.DATA_DIR, state_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def render(state):
+    """
+    Renders metric state in the Prometheus text format.
+
+    Args:
+        state (dict):   Metric state as returned by load_state().
+
+    Returns:
+        The text exposition as a string.
+    """
+    lines = []
+    for name in sorted(METRICS):
+        kind, help_text = METRICS[name]
+        series = [(name, s) for s in ('_sum', '_count')] if \
+                kind == 'summary' else [(name, '')]
+        if not any(state.get(base + suffix) for base, suffix in series):
+            continue
+        lines.append('# HELP {}{} {}'.format(PREFIX, name, help_text))
+        lines.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+        for base, suffix in series:
+            for label_key, value in sorted(state.get(base + suffix,
+                {}).items()):
+                labels = ','.join('{}="{}"'.format(k, str(v).replace('"',
+                    '\\"')) for k, v in sorted(json.loads(label_key).items()))
+                lines.append('{}{}{}{} {}'.format(PREFIX, base, suffix,
+                    '{' + labels + '}' if labels else '', value))
+    return '\n'.join(lines) + '\n'
+
+def main():
+    try:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+    except ImportError:
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+    port = app.args['port'] or 9410
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            with app.file_lock('metrics', shared=True):
+                body = render(load_state()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    print('Serving metrics on http://127.0.0.1:{}/metrics'.format(port))
+    try:
+        HTTPServer(('127.0.0.1', port), Handler).serve_forever()
+    except KeyboardInterrupt:
+        print('\nBye Felicia!')
+
+if __name__ == "__main__":
+    main()
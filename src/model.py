@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+    model.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Course and meeting time records shared by the utils. They are built once
+    from Banner registration JSON (or an RWeb grades row) with the dates,
+    days of the week and primary instructor already worked out, and use
+    __slots__ so holding many terms for many accounts stays small.
+"""
+import anti_banner as app
+from datetime import datetime
+
+# Banner day flags in mask bit order, with their RRULE BYDAY codes
+DAYS = (('monday', 'MO'), ('tuesday', 'TU'), ('wednesday', 'WE'),
+        ('thursday', 'TH'), ('friday', 'FR'), ('saturday', 'SA'),
+        ('sunday', 'SU'))
+
+def parse_date(unformatted):
+    """
+    Parses a Banner date (MM/DD/YYYY) into a date, or None if it is empty.
+    """
+    if not unformatted:
+        return None
+    return datetime.strptime(unformatted, '%m/%d/%Y').date()
+
+def parse_minutes(unformatted):
+    """
+    Parses a Banner time (hhmm) into minutes after midnight, or None if it
+    is empty.
+    """
+    if not unformatted:
+        return None
+    return int(unformatted[:2]) * 60 + int(unformatted[2:])
+
+class MeetingTime(object):
+    """
+    When and where a course meets.
+
+    Attributes:
+        start_date, end_date (date):    The first and last day of classes.
+        begin_time, end_time (string):  Banner times (hhmm), '' if unset.
+        begin, end (int):               The same times in minutes after
+                                        midnight, or None.
+        days (int):                     A mask of the days of the week, bit
+                                        0 is Monday (see DAYS).
+        building, building_description, room (string)
+    """
+    __slots__ = ('start_date', 'end_date', 'begin_time', 'end_time', 'begin',
+            'end', 'days', 'building', 'building_description', 'room')
+
+    def __init__(self, start_date=None, end_date=None, begin_time='',
+            end_time='', days=0, building='', building_description='',
+            room=''):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.begin_time = begin_time or ''
+        self.end_time = end_time or ''
+        self.begin = parse_minutes(begin_time)
+        self.end = parse_minutes(end_time)
+        self.days = days
+        self.building = building or ''
+        self.building_description = building_description or ''
+        self.room = room or ''
+
+    @classmethod
+    def from_banner(cls, times):
+        """
+        Builds a MeetingTime from an entry of a course's meetingTimes.
+        """
+        days = 0
+        for bit, (day, code) in enumerate(DAYS):
+            if times.get(day):
+                days |= 1 << bit
+        return cls(parse_date(times.get('startDate')),
+                parse_date(times.get('endDate')), times.get('beginTime'),
+                times.get('endTime'), days, times.get('building'),
+                times.get('buildingDescription'), times.get('room'))
+
+    def as_dict(self):
+        """
+        Gets the meeting time as a JSON friendly dict, dates in ISO format.
+        """
+        times = dict((name, getattr(self, name)) for name in self.__slots__)
+        for name in ('start_date', 'end_date'):
+            if times[name]:
+                times[name] = times[name].isoformat()
+        return times
+
+    def day_codes(self):
+        """
+        Gets the RRULE codes of the days the course meets on, i.e.
+        ['MO', 'WE', 'FR'].
+        """
+        return [code for bit, (day, code) in enumerate(DAYS)
+                if self.days & 1 << bit]
+
+class Course(object):
+    """
+    A registered course.
+
+    Attributes:
+        crn, term, subject, subject_description, number, section, title,
+        schedule, method, grade (string)
+        credits (number)
+        meetings (tuple):           MeetingTime entries, the first one is
+                                    the main one.
+        instructor, instructor_email (string):  The primary instructor, or
+                                    'Unavailable'.
+    """
+    __slots__ = ('crn', 'term', 'subject', 'subject_description', 'number',
+            'section', 'title', 'schedule', 'method', 'grade', 'credits',
+            'meetings', 'instructor', 'instructor_email')
+
+    def __init__(self, crn='', term='', subject='', subject_description='',
+            number='', section='', title='', schedule='', method='',
+            grade='', credits=None, meetings=(), instructor='Unavailable',
+            instructor_email='Unavailable'):
+        self.crn = crn
+        self.term = term
+        self.subject = subject
+        self.subject_description = subject_description
+        self.number = number
+        self.section = section
+        self.title = title
+        self.schedule = schedule
+        self.method = method or ''
+        self.grade = grade
+        self.credits = credits
+        self.meetings = tuple(meetings)
+        self.instructor = instructor
+        self.instructor_email = instructor_email
+
+    @classmethod
+    def from_banner(cls, course):
+        """
+        Builds a Course from one of the registrations in Banner JSON.
+        """
+        instructor, email = primary_instructor(course.get('faculty') or [])
+        return cls(course.get('courseReferenceNumber'),
+                course.get('termDescription'), course.get('subject'),
+                course.get('subjectDescription'), course.get('courseNumber'),
+                course.get('sequenceNumber'), course.get('courseTitle'),
+                course.get('scheduleDescription'),
+                course.get('instructionalMethodDescription'),
+                course.get('grade'), course.get('creditHours'),
+                [MeetingTime.from_banner(times) for times in
+                    course.get('meetingTimes') or []], instructor, email)
+
+    def as_dict(self):
+        """
+        Gets the course as a JSON friendly dict.
+        """
+        course = dict((name, getattr(self, name)) for name in self.__slots__)
+        course['meetings'] = [times.as_dict() for times in self.meetings]
+        return course
+
+    @property
+    def meeting(self):
+        """
+        The main meeting time, or None for courses without one.
+        """
+        return self.meetings[0] if self.meetings else None
+
+def primary_instructor(faculty):
+    """
+    Gets the primary instructor of a course.
+
+    Args:
+        faculty (list): The faculty of a course in Banner JSON.
+
+    Returns:
+        A tuple with the instructor name and email address.
+    """
+    # sometimes there are multiple faculty entries
+    for i in faculty:
+        if i.get('primaryIndicator'):
+            return (i.get('displayName'), i.get('emailAddress') or
+                    'Unavailable')
+    return ('Unavailable', 'Unavailable')
+
+def load_courses(data):
+    """
+    Builds the courses of a registration history.
+
+    Args:
+        data (string):  Registration JSON, i.e. the 'data' of a cache entry.
+
+    Returns:
+        A list of Course.
+    """
+    registrations = app.load_json(data)['data']['registrations'] or []
+    return [Course.from_banner(course) for course in registrations]
+
+def diff_courses(old, new):
+    """
+    Compares the courses of a term before and after a change.
+
+    Args:
+        old (list): A list of Course from before.
+        new (list): A list of Course from after.
+
+    Returns:
+        A list of dicts with the 'crn', 'field', 'old' and 'new' value of
+        every changed field. Added and dropped courses have the field None
+        and their title as the new or old value.
+    """
+    old = dict((course.crn, course) for course in old)
+    new = dict((course.crn, course) for course in new)
+    changes = []
+    for crn in sorted(set(old) | set(new)):
+        if crn not in old or crn not in new:
+            changes.append({ 'crn' : crn, 'field' : None,
+                'old' : old[crn].title if crn in old else None,
+                'new' : new[crn].title if crn in new else None })
+            continue
+        before, after = old[crn].as_dict(), new[crn].as_dict()
+        for field in Course.__slots__:
+            if before[field] != after[field]:
+                changes.append({ 'crn' : crn, 'field' : field,
+                    'old' : before[field], 'new' : after[field] })
+    return changes
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+    planner.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Decides when banner_changes should poll a term, so it can run from a
+    frequent cron job without polling all term long:
+
+    * every run polls around finals and while grades are being posted, and
+      in the hours of the week when changes were seen before (learned from
+      the snapshot history),
+    * otherwise the interval doubles with every poll that found nothing new,
+      from "poll_interval" up to "poll_max_interval" seconds,
+    * once every course has a grade the term is not polled anymore.
+
+    Run this file to print the plan for a term.
+
+    Example: `./planner.py -q spring -y 2017`
+"""
+import anti_banner as app
+import json
+import os
+import snapshots
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from model import load_courses
+
+state_file = 'planner.json'
+
+# seconds, overridden by "poll_interval" and "poll_max_interval"
+INTERVAL = 15 * 60
+MAX_INTERVAL = 24 * 60 * 60
+# the finals and grade posting window around the last day of classes
+FINALS_BEFORE = timedelta(days=7)
+GRADES_AFTER = timedelta(days=21)
+# hours of the week with at least this many past changes are kept hot
+LEARNED_MIN = 2
+LEARNED_TOP = 12
+
+_change_hours = None
+
+def hour_of_week(ts):
+    when = time.localtime(ts)
+    return (when.tm_wday, when.tm_hour)
+
+def change_hours():
+    """
+    Learns when changes usually happen from every term's snapshot history.
+
+    Returns:
+        A Counter of (weekday, hour) to the number of changes seen then.
+    """
+    global _change_hours
+    if _change_hours is None:
+        _change_hours = Counter()
+        try:
+            names = os.listdir(snapshots.store_path())
+        except OSError:
+            names = []
+        for name in names:
+            if name.endswith('.timeline'):
+                # the first snapshot of a term is not a change
+                for ts, digest in snapshots.timeline(name[:-9])[1:]:
+                    _change_hours[hour_of_week(ts)] += 1
+    return _change_hours
+
+def hot_hours():
+    """
+    Gets the hours of the week that had the most changes.
+    """
+    return set(hour for hour, count in change_hours().most_common(LEARNED_TOP)
+            if count >= LEARNED_MIN)
+
+def finals_window(courses):
+    """
+    Gets the finals and grade posting window of a term.
+
+    Args:
+        courses (list): A list of Course.
+
+    Returns:
+        A tuple of (start, end) datetimes, or None without meeting dates.
+    """
+    ends = [times.end_date for course in courses for times in course.meetings
+            if times.end_date]
+    if not ends:
+        return None
+    last_day = datetime.combine(max(ends), datetime.min.time())
+    return (last_day - FINALS_BEFORE, last_day + GRADES_AFTER)
+
+def load_state():
+    try:
+        with open(os.path.join(app.DATA_DIR, state_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def plan(key, cached, now=None):
+    """
+    Works out when a term should be polled next.
+
+    Args:
+        key (string):   The account scoped term, i.e. 'jdoe001_2017Spring'.
+        cached (dict):  The cache entry of the term.
+        now (float):    The current time, defaults to now.
+
+    Returns:
+        A tuple of (when, reason). when is a timestamp, None if the term
+        should not be polled again, and reason is one of 'graded', 'finals',
+        'learned' or 'backoff'.
+    """
+    now = now or time.time()
+    courses = load_courses(cached['data'])
+    if courses and all(course.grade for course in courses):
+        return (None, 'graded')
+
+    window = finals_window(courses)
+    if window and window[0] <= datetime.fromtimestamp(now) <= window[1]:
+        return (now, 'finals')
+    if hour_of_week(now) in hot_hours():
+        return (now, 'learned')
+
+    with app.file_lock('planner', shared=True):
+        state = load_state().get(key, {})
+    interval = min(app.get_config('poll_max_interval', MAX_INTERVAL),
+            app.get_config('poll_interval', INTERVAL) *
+            2 ** state.get('quiet', 0))
+    return (state.get('last', 0) + interval, 'backoff')
+
+def record(key, changed, now=None):
+    """
+    Records a poll of a term, resetting the backoff if it found changes. 
+    Only polls answered by Banner are recorded, never a cached copy served 
+    in its place (see get_schedule's fallback), or an outage would back 
+    polling off.
+
+    Args:
+        key (string):   The account scoped term.
+        changed (bool): If the poll found new changes.
+        now (float):    When the poll ran, defaults to now.
+    """
+    with app.file_lock('planner'):
+        state = load_state()
+        quiet = 0 if changed else state.get(key, {}).get('quiet', 0) + 1
+        # stop doubling once the interval is capped
+        state[key] = { 'last' : now or time.time(), 'quiet' : min(quiet, 32) }
+        # replaced whole, a torn file would drop every term's history
+        path = os.path.join(app.DATA_DIR, state_file)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+def main():
+    quarter, year = app.get_user_input()
+    term = '_{}{}'.format(year, quarter)
+    cached = app.get_cached(term)
+    if cached is None:
+        print('{} {} was never polled, the next run will.'.format(quarter,
+            year))
+        return
+    when, reason = plan(app.current_account() + term, cached)
+    if when is None:
+        print('Every {} {} course has a grade, not polling.'.format(quarter,
+            year))
+    else:
+        print('Next poll of {} {}: {} ({})'.format(quarter, year,
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(max(when,
+                time.time()))), reason))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+    rate_limit.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Token bucket rate limiter shared by every process using the same DATA_DIR, 
+    so cron jobs and ad-hoc runs together stay under a predictable request 
+    rate per host.
+"""
+import anti_banner as app
+import json
+import os
+import time
+import tracing
+
+bucket_file = 'rate_limit.json'
+
+# Requests per second and burst size per host. Override or add hosts with a 
+# "rate_limits" entry in credentials.json, i.e.
+#   "rate_limits" : { "auth.ucr.edu" : { "rate" : 0.5, "burst" : 2 } }
+# An override only needs the settings it changes, the rest are the host's 
+# (or the default) limits.
+RATE_LIMITS = {
+        'auth.ucr.edu' : { 'rate' : 1, 'burst' : 4 },
+        'registrationssb.ucr.edu' : { 'rate' : 1, 'burst' : 4 },
+        'default' : { 'rate' : 2, 'burst' : 8 },
+        }
+
+def get_limit(host):
+    """
+    Gets the rate limit for a host.
+
+    Args:
+        host (string):  The host being requested, i.e. 'auth.ucr.edu'.
+
+    Returns:
+        A dict with the 'rate' (tokens per second) and 'burst' (bucket size).
+    """
+
+    overrides = app.get_config('rate_limits', {})
+    limit = dict(RATE_LIMITS['default'])
+    limit.update(overrides.get('default', {}) if host not in RATE_LIMITS 
+            else RATE_LIMITS[host])
+    limit.update(overrides.get(host, {}))
+    return limit
+
+def acquire(host):
+    """
+    Blocks until a request to host is allowed and takes a token for it.
+
+    Args:
+        host (string):  The host about to be requested.
+    """
+
+    while True:
+        wait = try_acquire(host)
+        if not wait:
+            return
+        with tracing.span('rate_limit.wait', host=host):
+            time.sleep(wait)
+
+def try_acquire(host):
+    """
+    Takes a token for a request to host if one is available, without 
+    waiting, i.e. for an event loop to do the waiting itself.
+
+    Args:
+        host (string):  The host about to be requested.
+
+    Returns:
+        0 if a token was taken, otherwise the seconds until one is due.
+    """
+
+    limit = get_limit(host)
+    with app.file_lock('rate_limit'):
+        buckets = load_buckets()
+        now = time.time()
+        bucket = buckets.get(host, 
+                { 'tokens' : limit['burst'], 'updated' : now })
+        tokens = min(limit['burst'], bucket['tokens'] + 
+                (now - bucket['updated']) * limit['rate'])
+        if tokens < 1:
+            return (1 - tokens) / limit['rate']
+        buckets[host] = { 'tokens' : tokens - 1, 'updated' : now }
+        # replaced whole, a crash mid-write can't leave it truncated
+        path = os.path.join(app.DATA_DIR, bucket_file)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(buckets, f)
+        os.replace(path + '.tmp', path)
+        return 0
+
+def load_buckets():
+    """
+    Loads the token buckets of every host from DATA_DIR.
+
+    Returns:
+        A dict of host to {'tokens', 'updated'}.
+    """
+
+    try:
+        with open(os.path.join(app.DATA_DIR, bucket_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
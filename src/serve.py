@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+    serve.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Anti-Banner Server - Serves terms, courses, grades, GPA and iCalendar
+    schedules of every configured account over HTTP from the cache.
+
+    Reads never wait on Banner: entries older than "serve_ttl" seconds
+    (default 300) are served as they are while a background refresh runs
+    (stale-while-revalidate), and every response has an ETag so unchanged
+    data costs a 304. A term that was never cached is answered with a 404
+    while it is fetched in the background, if it is within RECENT_YEARS of
+    this year. With --cached nothing is ever refreshed.
+
+    Example: `./serve.py --port 9420`
+
+    GET /accounts
+    GET /<netID>/terms
+    GET /<netID>/gpa
+    GET /<netID>/<year>/<quarter>/courses
+    GET /<netID>/<year>/<quarter>/grades
+    GET /<netID>/<year>/<quarter>/schedule.ics
+"""
+import anti_banner as app
+import hashlib
+import json
+import logs
+import metrics
+import re
+import threading
+import time
+from datetime import timedelta
+from banner_connect import get_schedule, get_session
+from gpa import get_gpa, sid_from_cred
+from lru import LRU
+from model import load_courses
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+app_name = 'Server'
+version = '1.0'
+PORT = 9420
+# seconds before cached data is refreshed in the background
+TTL = 300
+# uncached terms this many years around this year are fetched on request
+RECENT_YEARS = 1
+timeZone = 'America/Los_Angeles'
+
+TERM_KEY = re.compile(r'^(.*)_(\d{4})(Fall|Winter|Spring|Summer)$')
+
+_accounts = {}
+_refreshing = set()
+_lock = threading.Lock()
+_gpa = {}
+# the cached terms of every account, as of a store_version()
+_terms = { 'version' : None, 'terms' : {} }
+# rendered bodies by (cache key, kind, data hash)
+_rendered = LRU(256, 32 * 1024 * 1024, sizeof=lambda body: len(body[0]))
+
+class NotFound(Exception):
+    pass
+
+def load_accounts():
+    """
+    Maps the netID of every configured account to its login, None for the
+    default account.
+    """
+    for login in app.get_accounts():
+        _accounts[login[0] if login else app.current_account()] = login
+
+def ttl():
+    return app.get_config('serve_ttl', TTL)
+
+def term_key(account, quarter, year):
+    """
+    Gets the cache key of an account's term, see app.account_key().
+    """
+    login = _accounts[account]
+    return app.account_key('_{}{}'.format(year, quarter),
+            login[0] if login else None)
+
+def refresh(key, fetch):
+    """
+    Runs fetch() in a background thread, unless a refresh of key is already
+    running.
+    """
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            fetch()
+        except Exception as e:
+            logs.log_event('errors', 'Background refresh failed',
+                    logs.logging.ERROR, error=str(e), key=str(key))
+        finally:
+            with _lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def get_entry(account, quarter, year):
+    """
+    Gets the cache entry of a term, refreshing it in the background if it
+    is older than the TTL. A recent term that was never cached is fetched in
+    the background too, requests never wait on Banner.
+
+    Returns:
+        The cache entry.
+
+    Raises:
+        NotFound: if the term is not cached (yet).
+    """
+    key = term_key(account, quarter, year)
+    login = _accounts[account]
+    entry = app.get_cached(key)
+    if entry is None:
+        if app.CACHED or abs(int(year) - time.localtime().tm_year) > \
+                RECENT_YEARS:
+            raise NotFound('{} {} is not cached'.format(quarter, year))
+        refresh(key, lambda: get_schedule(quarter, year, login=login))
+        raise NotFound('{} {} is not cached yet, try again shortly'.format(
+            quarter, year))
+    elif not app.CACHED and time.time() - entry.get('fetched', 0) > ttl():
+        refresh(key, lambda: get_schedule(quarter, year, login=login))
+    return entry
+
+def render(account, quarter, year, kind):
+    """
+    Renders one view of a term, reusing the last rendering while the cached
+    data has the same hash.
+
+    Returns:
+        A tuple of (body, content type, ETag, fetched).
+    """
+    entry = get_entry(account, quarter, year)
+    cache_key = (term_key(account, quarter, year), kind, entry['hash'])
+    rendered = _rendered.get(cache_key)
+    if rendered is None:
+        courses = load_courses(entry['data'])
+        if kind == 'courses':
+            body = to_json([course.as_dict() for course in courses])
+            content_type = 'application/json'
+        elif kind == 'grades':
+            body = to_json([{ 'crn' : course.crn, 'subject' : course.subject,
+                'number' : course.number, 'title' : course.title,
+                'grade' : course.grade } for course in courses])
+            content_type = 'application/json'
+        else:
+            body = to_ics(courses, '{} {}'.format(quarter, year))
+            content_type = 'text/calendar; charset=utf-8'
+        rendered = (body, content_type)
+        _rendered.put(cache_key, rendered)
+    return rendered + ('"{}-{}"'.format(entry['hash'][:16], kind),
+            entry.get('fetched', 0))
+
+def render_accounts():
+    """
+    Lists the configured accounts.
+    """
+    body = to_json(sorted(_accounts))
+    return (body, 'application/json', etag(body), time.time())
+
+def render_terms(account):
+    """
+    Lists the cached terms of an account.
+    """
+    login = _accounts[account]
+    body = to_json(cached_terms().get(login[0] if login else '', []))
+    return (body, 'application/json', etag(body), time.time())
+
+def cached_terms():
+    """
+    Groups the cached terms by the account part of their key, listing the
+    cache again only after it was written to.
+
+    Returns:
+        A dict of netID, '' for the default account, to a list of
+        { 'year' : ..., 'quarter' : ... }.
+    """
+    version = app.store_version()
+    with _lock:
+        if _terms['version'] != version:
+            terms = {}
+            for key in sorted(app.cache_index()):
+                match = TERM_KEY.match(key)
+                if match:
+                    terms.setdefault(match.group(1), []).append({
+                        'year' : match.group(2),
+                        'quarter' : match.group(3).lower() })
+            _terms.update({ 'version' : version, 'terms' : terms })
+        return _terms['terms']
+
+def render_gpa(account):
+    """
+    Gets the GPA of an account, which is kept in memory and refreshed like
+    cached terms.
+    """
+    login = _accounts[account]
+    sid = sid_from_cred() if login is None else dict((a['netID'], a)
+            for a in app.get_config('accounts', []))[account].get('sid')
+    if sid is None:
+        raise NotFound('No SID is configured for {}'.format(account))
+
+    def fetch():
+        session = get_session(login=login)[0]
+        _gpa[account] = (get_gpa(sid, session), time.time())
+
+    if account not in _gpa:
+        if app.CACHED:
+            raise NotFound('The GPA of {} is not cached'.format(account))
+        refresh((account, 'gpa'), fetch)
+        raise NotFound('The GPA of {} is not cached yet, try again shortly'
+                .format(account))
+    elif not app.CACHED and time.time() - _gpa[account][1] > ttl():
+        refresh((account, 'gpa'), fetch)
+    gpa, fetched = _gpa[account]
+    body = to_json({ 'gpa' : gpa })
+    return (body, 'application/json', etag(body), fetched)
+
+def to_json(obj):
+    return json.dumps(obj, sort_keys=True).encode('utf-8')
+
+def etag(body):
+    return '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+
+def ics_text(text):
+    """
+    Escapes text for an iCalendar property value.
+    """
+    return str(text).replace('\\', '\\\\').replace(';', '\\;') \
+            .replace(',', '\\,').replace('\n', '\\n')
+
+def fold(line):
+    """
+    Folds an iCalendar content line into lines of at most 75 octets, as
+    RFC 5545 requires, without splitting a UTF-8 character.
+    """
+    parts = []
+    chunk = ''
+    size = 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        # continuation lines start with a space
+        if size + width > (74 if parts else 75):
+            parts.append(chunk)
+            chunk = ''
+            size = 0
+        chunk += char
+        size += width
+    parts.append(chunk)
+    return '\r\n '.join(parts)
+
+def to_ics(courses, name):
+    """
+    Renders courses as an iCalendar file with a weekly recurring event per
+    course meeting time.
+
+    Args:
+        courses (list): A list of Course.
+        name (string):  The calendar name, i.e. 'Spring 2017'.
+
+    Returns:
+        The calendar as bytes.
+    """
+    stamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0',
+            'PRODID:-//Anti-Banner//Schedule//EN',
+            'X-WR-CALNAME:' + ics_text(name), 'X-WR-TIMEZONE:' + timeZone]
+    for course in courses:
+        for i, times in enumerate(course.meetings):
+            if times.begin is None or not times.days or not times.start_date:
+                continue
+            # the first day on or after the start date the course meets on
+            first = times.start_date
+            while not times.days & 1 << first.weekday():
+                first += timedelta(days=1)
+            day = first.strftime('%Y%m%d')
+            lines += ['BEGIN:VEVENT',
+                    'UID:{}-{}-{}@anti-banner'.format(course.crn, i,
+                        name.replace(' ', '').lower()),
+                    'DTSTAMP:' + stamp,
+                    'SUMMARY:' + ics_text('{}-{}-{} - {}'.format(
+                        course.subject, course.number, course.section,
+                        course.title.title())),
+                    'LOCATION:' + ics_text('{} ({}) {}'.format(
+                        times.building_description, times.building,
+                        times.room)),
+                    'DESCRIPTION:' + ics_text('Instructor: {}\n'
+                        'Instructor email: {}\n{}'.format(course.instructor,
+                            course.instructor_email, course.schedule)),
+                    'DTSTART;TZID={}:{}T{}00'.format(timeZone, day,
+                        times.begin_time),
+                    'DTEND;TZID={}:{}T{}00'.format(timeZone, day,
+                        times.end_time or times.begin_time),
+                    'RRULE:FREQ=WEEKLY;BYDAY={}{}'.format(
+                        ','.join(times.day_codes()), ';UNTIL={}T235959Z'
+                        .format(times.end_date.strftime('%Y%m%d'))
+                        if times.end_date else ''),
+                    'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(fold(line) for line in lines) + '\r\n').encode(
+            'utf-8')
+
+ROUTES = [
+        (re.compile(r'^/accounts$'), render_accounts),
+        (re.compile(r'^/([^/]+)/terms$'), render_terms),
+        (re.compile(r'^/([^/]+)/gpa$'), render_gpa),
+        (re.compile(r'^/([^/]+)/(\d{4})/(\w+)/(courses|grades)$'),
+            lambda account, year, quarter, kind: render(account,
+                term_quarter(quarter), year, kind)),
+        (re.compile(r'^/([^/]+)/(\d{4})/(\w+)/schedule\.ics$'),
+            lambda account, year, quarter: render(account,
+                term_quarter(quarter), year, 'ics')),
+        ]
+
+def term_quarter(quarter):
+    quarter = app.decode_quarter(quarter)
+    if quarter is None:
+        raise NotFound('Unknown quarter')
+    return quarter
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        try:
+            for route, view in ROUTES:
+                match = route.match(path)
+                if match:
+                    if match.groups() and match.group(1) not in _accounts:
+                        raise NotFound('Unknown account')
+                    body, content_type, tag, fetched = view(*match.groups())
+                    break
+            else:
+                raise NotFound('Not found')
+        except NotFound as e:
+            return self.reply(404, to_json({ 'error' : str(e) }),
+                    'application/json')
+        except app.BannerError as e:
+            return self.reply(502, to_json({ 'error' : str(e) }),
+                    'application/json')
+        except Exception as e:
+            logs.log_event('errors', 'Request failed', logs.logging.ERROR,
+                    error='{}: {}'.format(type(e).__name__, e), path=path)
+            return self.reply(500, to_json({ 'error' : 'Internal error' }),
+                    'application/json')
+
+        headers = { 'ETag' : tag, 'Age' : str(max(0,
+            int(time.time() - fetched))), 'Cache-Control' :
+            'max-age={}'.format(ttl()) }
+        if tag in self.headers.get('If-None-Match', ''):
+            return self.reply(304, b'', None, headers)
+        self.reply(200, body, content_type, headers)
+
+    def reply(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def main():
+    if not app.SILENT:
+        app.print_greeting(app_name, version)
+    load_accounts()
+    metrics.flush_every()
+    port = app.args['port'] or PORT
+    server = Server(('127.0.0.1', port), Handler)
+    if not app.SILENT:
+        print('Serving {} accounts on http://127.0.0.1:{}/'.format(
+            len(_accounts), server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nBye Felicia!')
+
+if __name__ == "__main__":
+    main()
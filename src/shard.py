@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+    shard.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Anti-Banner Poll Worker - Polls the configured accounts for changes
+    together with every other worker using the same lease database (see
+    leases.py). Each worker takes leases on an even share of the accounts,
+    so run one per process or node you want to spread the polling over.
+    When a worker stops, its leases expire and the others take over its
+    accounts.
+
+    Example: `./shard.py -q spring -y 2017 --silent`
+"""
+import anti_banner as app
+import banner_changes
+import hashlib
+import leases
+import logs
+import metrics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+app_name = 'Poll Worker'
+version = '1.0'
+# seconds between polling rounds, overridden by "shard_round"
+ROUND = 60
+# accounts polled at the same time by one worker
+WORKERS = 4
+
+def account_name(login):
+    return login[0] if login else app.current_account()
+
+def preference(account):
+    """
+    Ranks accounts for this worker (rendezvous hashing), so every worker
+    prefers a different, stable set of accounts.
+    """
+    return hashlib.sha1('{}/{}'.format(leases.worker_id(), account)
+            .encode('utf-8')).hexdigest()
+
+def resource(account):
+    return 'account:' + account
+
+def claim(accounts, ttl):
+    """
+    Takes leases on this worker's share of the accounts, and gives up
+    leases above the share when more workers joined.
+
+    Args:
+        accounts (list):    The netIDs to share out.
+        ttl (float):        Seconds the leases last.
+
+    Returns:
+        The netIDs this worker holds leases on.
+    """
+    workers = leases.heartbeat(ttl)
+    share = -(-len(accounts) // workers)
+    ranked = sorted(accounts, key=preference)
+    held = leases.held()
+    mine = [account for account in ranked if resource(account) in held]
+    for account in mine[share:]:
+        leases.release(resource(account))
+    mine = mine[:share]
+    for account in ranked:
+        if len(mine) >= share:
+            break
+        if account not in mine and leases.acquire(resource(account), ttl):
+            mine.append(account)
+    return mine
+
+def poll(quarter, year, login, ttl):
+    """
+    Polls one account, if this worker still holds its lease. A failure is
+    logged, so it doesn't end the round for the other accounts.
+    """
+    account = account_name(login)
+    try:
+        if leases.acquire(resource(account), ttl):
+            banner_changes.check_account(quarter, year, login)
+    except Exception as e:
+        logs.log_event('changes', 'Poll failed', logs.logging.ERROR,
+                error='{}: {}'.format(type(e).__name__, e), account=account,
+                term='_{}{}'.format(year, quarter))
+        if not app.SILENT:
+            print('Polling {} failed: {}'.format(account, e))
+
+def main():
+    if not app.SILENT:
+        app.print_greeting(app_name, version)
+
+    quarter, year = app.get_user_input()
+    logins = dict((account_name(login), login)
+            for login in app.get_accounts())
+    every = app.get_config('shard_round', ROUND)
+    # a lease outlives a slow round
+    ttl = max(leases.LEASE_TTL, 3 * every)
+
+    try:
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            while True:
+                start = time.time()
+                mine = claim(sorted(logins), ttl)
+                if not app.SILENT:
+                    print('{} polling {} of {} accounts'.format(
+                        leases.worker_id(), len(mine), len(logins)))
+                list(pool.map(lambda account: poll(quarter, year,
+                    logins[account], ttl), mine))
+                # export this round's metrics while the worker keeps running
+                metrics.flush()
+                time.sleep(max(0, every - (time.time() - start)))
+    except KeyboardInterrupt:
+        print('\nBye Felicia!')
+    finally:
+        # hand the accounts over now, not when the leases expire
+        leases.retire()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+    sinks.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Fans detected changes out to every configured output. Each sink has its
+    own queue and thread, so a slow or failing sink never holds up polling
+    or the other sinks. When a queue is full, its oldest event is dropped.
+    Publishers are told which sinks sent an event, so events that a sink
+    failed or dropped can be sent again (see leases.claim_notification()).
+
+    Sinks are listed under "sinks" in credentials.json, i.e.
+        "sinks" : [
+            { "type" : "pushbullet" },
+            { "type" : "ifttt", "channel" : "banner_changes" },
+            { "type" : "webhook", "url" : "https://example.com/hook" },
+            { "type" : "file", "path" : "/var/spool/anti-banner.jsonl" },
+            { "type" : "calendar" }
+        ]
+    Without "sinks", changes go to Pushbullet as they always have.
+"""
+import anti_banner as app
+import atexit
+import json
+import logs
+import metrics
+import os
+import threading
+import time
+from model import load_courses
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import requests
+
+# events waiting per sink before the oldest is dropped
+QUEUE_SIZE = 100
+# seconds a process waits at exit for queued events to go out
+DRAIN_TIMEOUT = 30
+# (connect, read) timeout in seconds, and retries of a failed POST with
+# exponential backoff, for the HTTP sinks
+TIMEOUT = (5, 30)
+RETRIES = 2
+BACKOFF = 1
+# answers that are retried when they say when to (Retry-After), and the
+# longest wait honored
+RETRY_STATUS = (429, 503)
+MAX_RETRY_AFTER = 60
+
+_sinks = None
+_lock = threading.Lock()
+
+class SinkError(Exception):
+    """
+    Raised when a sink rejects an event.
+    """
+    pass
+
+class Sink(object):
+    """
+    An output for change events. Subclasses implement send().
+
+    Args:
+        name (string):      Names the sink in logs and metrics.
+        queue_size (int):   Events held before the oldest is dropped.
+    """
+
+    def __init__(self, name, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.session = requests.Session()
+
+    def offer(self, event, sent=None):
+        """
+        Queues an event without ever blocking the caller.
+
+        Args:
+            event (dict):       The change, see change_event().
+            sent (function):    Optional, called with the sink name once the
+                                event was sent.
+        """
+        with _lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,
+                        name='sink-' + self.name, daemon=True)
+                self.thread.start()
+        while True:
+            try:
+                self.queue.put_nowait((event, sent))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    metrics.inc('sink_dropped_total', sink=self.name)
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while True:
+            event, sent = self.queue.get()
+            try:
+                if self.deliver(event) is None and sent:
+                    sent(self.name)
+            except Exception as e:
+                logs.log_event('changes', 'Notification not confirmed',
+                        logs.logging.ERROR, sink=self.name, error=str(e),
+                        account=event['account'], term=event['term'])
+            finally:
+                self.queue.task_done()
+
+    def deliver(self, event):
+        """
+        Sends an event, and logs and counts the outcome.
+
+        Returns:
+            None if it was sent, otherwise the error as a string.
+        """
+        start = time.time()
+        error = None
+        try:
+            self.send(event)
+        except Exception as e:
+            # a failing sink must not take its thread down
+            error = str(e)
+        metrics.observe('notification_seconds', time.time() - start,
+                account=event['account'], sink=self.name)
+        metrics.inc('notifications_total', account=event['account'],
+                sink=self.name)
+        if error:
+            metrics.inc('notification_failures_total',
+                    account=event['account'], sink=self.name)
+            logs.log_event('changes', 'Notification error',
+                    logs.logging.ERROR, sink=self.name, error=error,
+                    account=event['account'], term=event['term'])
+        else:
+            logs.log_event('changes', 'Notification sent', sink=self.name,
+                    account=event['account'], term=event['term'])
+        return error
+
+    def send(self, event):
+        raise NotImplementedError
+
+    def post(self, url, **kwargs):
+        """
+        POSTs to an HTTP endpoint, raising SinkError unless it answers 2xx.
+        Sinks aren't Banner, so this skips Banner's rate limits, breaker and
+        recording. A POST is not safe to send twice, so it is only retried
+        when it never got to the server (a connection error or connect
+        timeout) or the server turned it away with a Retry-After, never
+        after a read timeout or a server error.
+        """
+        kwargs.setdefault('timeout', TIMEOUT)
+        for attempt in range(RETRIES + 1):
+            try:
+                response = self.session.post(url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # ConnectTimeout included, ReadTimeout is not
+                response = None
+                error = str(e)
+                wait = BACKOFF * 2 ** attempt
+            else:
+                wait = retry_after(response)
+                if wait is None:
+                    break
+                error = 'HTTP {}'.format(response.status_code)
+            if attempt < RETRIES:
+                time.sleep(wait)
+        if response is None:
+            raise SinkError('{} failed after {} attempts: {}'.format(url,
+                RETRIES + 1, error))
+        if not 200 <= response.status_code < 300:
+            raise SinkError('HTTP {}: {}'.format(response.status_code,
+                response.text[:200]))
+        return response
+
+def retry_after(response):
+    """
+    Gets the seconds to wait before resending a request the server turned
+    away, or None if it should not be resent.
+    """
+    wait = response.headers.get('Retry-After', '')
+    if response.status_code not in RETRY_STATUS or not wait.isdigit():
+        return None
+    return min(int(wait), MAX_RETRY_AFTER)
+
+class Pushbullet(Sink):
+    url = 'https://api.pushbullet.com/v2/pushes'
+
+    def __init__(self, name='pushbullet', key=None, **options):
+        Sink.__init__(self, name, **options)
+        self.key = key or app.get_config('pushbullet')
+
+    def send(self, event):
+        if not self.key:
+            raise SinkError('Error finding API key!')
+        self.post(self.url, auth=(self.key, ''), data={ 'type' : 'note',
+            'title' : event['title'], 'body' : event['body'] or '' })
+
+class Ifttt(Sink):
+    url = 'https://maker.ifttt.com/trigger/{}/with/key/{}'
+
+    def __init__(self, name='ifttt', key=None, channel='banner_changes',
+            **options):
+        Sink.__init__(self, name, **options)
+        self.key = key or app.get_config('ifttt')
+        self.channel = channel
+
+    def send(self, event):
+        if not self.key:
+            raise SinkError('Error finding API key!')
+        self.post(self.url.format(self.channel, self.key),
+                data={ 'value1' : event['body'] })
+
+class Webhook(Sink):
+    def __init__(self, url, name='webhook', **options):
+        Sink.__init__(self, name, **options)
+        self.url = url
+
+    def send(self, event):
+        self.post(self.url, json=event)
+
+class File(Sink):
+    """
+    Appends events as JSON lines, i.e. as a spool other tools consume.
+    """
+
+    def __init__(self, path, name='file', **options):
+        Sink.__init__(self, name, **options)
+        self.path = path if os.path.isabs(path) else \
+                os.path.join(app.DATA_DIR, path)
+
+    def send(self, event):
+        with app.file_lock('sink_' + os.path.basename(self.path)), \
+                open(self.path, 'a') as spool:
+            spool.write(json.dumps(event, sort_keys=True) + '\n')
+
+class Calendar(Sink):
+    """
+    Patches the Google Calendar events add_to_gcal.py imported for the 
+    courses that changed.
+    """
+
+    def __init__(self, name='calendar', **options):
+        Sink.__init__(self, name, **options)
+
+    def send(self, event):
+        # the Google API client is only needed once a calendar is synced
+        import add_to_gcal
+        cached = app.get_cached(event['key'])
+        add_to_gcal.resync(event['key'], event['changes'], 
+                load_courses(cached['data']))
+
+SINK_TYPES = {
+        'pushbullet' : Pushbullet,
+        'ifttt' : Ifttt,
+        'webhook' : Webhook,
+        'file' : File,
+        'calendar' : Calendar,
+        }
+
+def get_sinks():
+    """
+    Builds the configured sinks, once per process.
+
+    Returns:
+        A list of Sink.
+    """
+    global _sinks
+    with _lock:
+        if _sinks is None:
+            configured = app.get_config('sinks') or [{ 'type' : 'pushbullet' }]
+            _sinks = []
+            for options in configured:
+                options = dict(options)
+                _sinks.append(SINK_TYPES[options.pop('type')](**options))
+            atexit.register(drain)
+    return _sinks
+
+def publish(event, sent=None, skip=()):
+    """
+    Hands a change event to every sink and returns right away.
+
+    Args:
+        event (dict):       The change, see change_event().
+        sent (function):    Optional, called with a sink's name once that
+                            sink sent the event.
+        skip (list):        Names of sinks that already sent the event.
+    """
+    for sink in get_sinks():
+        if sink.name not in skip:
+            sink.offer(event, sent)
+
+def send_now(event):
+    """
+    Sends an event to every sink and waits for them, i.e. for --test.
+
+    Returns:
+        A list of (sink name, error), error is None if the event was sent.
+    """
+    return [(sink.name, sink.deliver(event)) for sink in get_sinks()]
+
+def drain(timeout=DRAIN_TIMEOUT):
+    """
+    Waits for queued events to go out, runs at exit.
+    """
+    deadline = time.time() + timeout
+    for sink in _sinks or []:
+        while sink.queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+def change_event(account, key, quarter, year, digest, body, changes):
+    """
+    Builds the event sinks get for a change.
+
+    Args:
+        account (string):   The netID.
+        key (string):       The cache key of the term.
+        quarter (string):   The academic quarter.
+        year (string):      The academic year.
+        digest (string):    The hash of the new registration data.
+        body (string):      The notification text, i.e. the grades.
+        changes (list):     What changed, see model.diff_courses().
+
+    Returns:
+        The event as a JSON friendly dict.
+    """
+    return { 'account' : account, 'key' : key, 
+            'term' : '_{}{}'.format(year, quarter),
+            'quarter' : quarter, 'year' : year, 'hash' : digest,
+            'title' : 'New grades!', 'body' : body, 'changes' : changes,
+            'ts' : time.time() }
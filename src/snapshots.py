@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+    snapshots.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Append-only history of registration data. Every distinct state of a term
+    is kept once: each course is stored as a compressed, content-addressed
+    block, and a snapshot only lists the blocks of its courses, so a poll
+    that changed one grade adds one small block plus the snapshot.
+
+    Run this file to print the history of a term.
+
+    Example: `./snapshots.py -q spring -y 2017`
+"""
+import anti_banner as app
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+
+snapshot_dir = 'snapshots'
+
+def store_path(*parts):
+    return os.path.join(app.DATA_DIR, snapshot_dir, *parts)
+
+def put_block(obj):
+    """
+    Stores an object as a compressed block named by the hash of its content.
+
+    Args:
+        obj:    Any JSON serializable object.
+
+    Returns:
+        The block hash.
+    """
+    raw = json.dumps(obj, sort_keys=True, separators=(',', ':')) \
+            .encode('utf-8')
+    digest = hashlib.sha1(raw).hexdigest()
+    path = store_path('blocks', digest[:2], digest[2:])
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a temp file of its own, other threads and processes may be writing
+        # the same block, which is fine as its content is the same
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as block:
+                block.write(zlib.compress(raw, 9))
+            os.replace(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+    return digest
+
+def get_block(digest):
+    """
+    Loads a block stored by put_block().
+    """
+    with open(store_path('blocks', digest[:2], digest[2:]), 'rb') as block:
+        return json.loads(zlib.decompress(block.read()).decode('utf-8'))
+
+def timeline_path(key):
+    return store_path('{}.timeline'.format(key))
+
+def record(key, data, ts=None):
+    """
+    Adds the registration data of a term to its history, unless it is the
+    same as the latest snapshot.
+
+    Args:
+        key (string):   The cache key of the term, i.e. '_2017Spring'.
+        data (string):  The raw registration JSON from Banner.
+        ts (float):     When the data was fetched, defaults to now.
+
+    Returns:
+        The snapshot hash.
+    """
+    registrations = app.load_json(data)['data']['registrations'] or []
+    manifest = dict((course['courseReferenceNumber'], put_block(course))
+            for course in registrations)
+    digest = put_block(manifest)
+
+    with app.file_lock('snapshots'):
+        entries = timeline(key)
+        if entries and entries[-1][1] == digest:
+            return digest
+        with open(timeline_path(key), 'a') as line:
+            line.write('{} {}\n'.format(round(ts or time.time(), 3), digest))
+    return digest
+
+def timeline(key):
+    """
+    Gets the snapshots of a term.
+
+    Args:
+        key (string):   The cache key of the term.
+
+    Returns:
+        A list of (timestamp, snapshot hash), oldest first.
+    """
+    try:
+        with open(timeline_path(key)) as lines:
+            return [(float(ts), digest) for ts, digest in
+                    (line.split() for line in lines if line.strip())]
+    except IOError:
+        return []
+
+def snapshot(digest):
+    """
+    Loads a snapshot.
+
+    Args:
+        digest (string):    The snapshot hash.
+
+    Returns:
+        A dict of CRN to course data.
+    """
+    return dict((crn, get_block(block)) for crn, block in
+            get_block(digest).items())
+
+def changes(key):
+    """
+    Walks the history of a term and reports what changed in each snapshot.
+
+    Args:
+        key (string):   The cache key of the term.
+
+    Returns:
+        A generator of (timestamp, crn, field, old value, new value). Added
+        and dropped courses are reported with the field None.
+    """
+    previous = {}
+    for ts, digest in timeline(key):
+        current = get_block(digest)
+        for crn in sorted(set(previous) | set(current)):
+            if previous.get(crn) == current.get(crn):
+                continue
+            if crn not in previous or crn not in current:
+                yield (ts, crn, None, crn in previous, crn in current)
+                continue
+            old, new = get_block(previous[crn]), get_block(current[crn])
+            for field in sorted(set(old) | set(new)):
+                if old.get(field) != new.get(field):
+                    yield (ts, crn, field, old.get(field), new.get(field))
+        previous = current
+
+def first_seen(key, crn, field):
+    """
+    Answers i.e. "when did this grade appear?".
+
+    Args:
+        key (string):   The cache key of the term.
+        crn (string):   The course reference number.
+        field (string): The course field, i.e. 'grade'.
+
+    Returns:
+        A tuple of (timestamp, value) of the first snapshot where the field
+        had a value, or None.
+    """
+    last = None
+    for ts, digest in timeline(key):
+        block = get_block(digest).get(crn)
+        if block and block != last:
+            value = get_block(block).get(field)
+            if value:
+                return (ts, value)
+        last = block
+    return None
+
+def main():
+    quarter, year = app.get_user_input()
+    key = '_{}{}'.format(year, quarter)
+    entries = timeline(key)
+    if not entries:
+        print('No history for {} {} yet.'.format(quarter, year))
+        return
+
+    print('{} snapshots of {} {}\n'.format(len(entries), quarter, year))
+    for ts, crn, field, old, new in changes(key):
+        when = time.strftime('%Y-%m-%d %H:%M', time.localtime(ts))
+        if field is None:
+            print('{}  {}  {}'.format(when, crn, 'added' if new else 'dropped'))
+        else:
+            print('{}  {}  {}: {!r} -> {!r}'.format(when, crn, field, old, new))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+    timetable.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Anti-Banner Timetable - An index over the meeting times of every cached
+    term of every account, for questions like who is in class at 10:00 on
+    Tuesday, which courses conflict, and where the free time is.
+
+    Meeting times are bucketed by quarter hour of the week, and each term
+    keeps a bitmask of its busy minutes, so queries only look at the
+    meetings that can match. refresh() re-indexes just the terms whose
+    cache entry changed.
+
+    Example: `./timetable.py -q spring -y 2017`
+"""
+import anti_banner as app
+import threading
+from collections import namedtuple
+from model import DAYS, load_courses
+
+app_name = 'Timetable'
+version = '1.0'
+# minutes per bucket of the week
+BUCKET = 15
+MINUTES = 24 * 60
+BUCKETS = 7 * MINUTES // BUCKET
+# the part of the day free time is looked for in
+DAY_START = 8 * 60
+DAY_END = 22 * 60
+
+Booking = namedtuple('Booking', 'key account term course times')
+
+def minute_mask(day, begin, end):
+    """
+    Gets the bits of a stretch of a day in a busy mask, where bit n is
+    minute n of the week (from Monday 00:00).
+    """
+    return ((1 << (end - begin)) - 1) << (day * MINUTES + begin)
+
+def buckets_of(times):
+    """
+    Gets the buckets of the week a meeting time falls in.
+    """
+    for day in range(len(DAYS)):
+        if times.days & 1 << day:
+            first = (day * MINUTES + times.begin) // BUCKET
+            last = (day * MINUTES + times.end - 1) // BUCKET
+            for bucket in range(first, last + 1):
+                yield bucket
+
+def overlap(a, b):
+    """
+    Checks if two meeting times are ever at the same time.
+    """
+    if not a.days & b.days or a.begin >= b.end or b.begin >= a.end:
+        return False
+    return not (a.start_date and b.end_date and a.start_date > b.end_date or
+            b.start_date and a.end_date and b.start_date > a.end_date)
+
+class Timetable(object):
+    """
+    Meeting times of the cached terms, indexed by quarter hour of the week.
+
+    Examples:
+        >>> from model import Course, MeetingTime
+        >>> tuesday = 1 << 1
+        >>> timetable = Timetable()
+        >>> timetable.add('_2017Spring', [
+        ...     Course(crn='10001', meetings=(MeetingTime(begin_time='0940',
+        ...         end_time='1100', days=tuesday),)),
+        ...     Course(crn='10004', meetings=(MeetingTime(begin_time='1000',
+        ...         end_time='1050', days=tuesday),))])
+        >>> [b.course.crn for b in timetable.at(1, 10 * 60)]
+        ['10001', '10004']
+        >>> timetable.free('_2017Spring', 1)
+        [(480, 580), (660, 1320)]
+
+        refresh() fills it from the cache instead.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.hashes = {}
+        self.bookings = {}
+        self.busy = {}
+        self.buckets = [set() for i in range(BUCKETS)]
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Brings the index up to date with the cache, re-indexing only the
+        terms whose data changed since the last refresh.
+
+        Returns:
+            The number of terms that were (re-)indexed or dropped.
+        """
+        with self._lock:
+            version = app.store_version()
+            if version == self.version:
+                return 0
+            hashes = dict((key, entry['hash']) for key, entry in 
+                    app.cache_index().items())
+            updated = 0
+            for key in set(self.hashes) - set(hashes):
+                self.remove(key)
+                updated += 1
+            for key in sorted(hashes):
+                if key in self.hashes and hashes[key] == self.hashes[key]:
+                    continue
+                entry = app.get_cached(key)
+                if entry is None:
+                    continue
+                try:
+                    courses = load_courses(entry['data'])
+                except (ValueError, KeyError, TypeError):
+                    # not registration data, i.e. an old error response
+                    continue
+                self.remove(key)
+                self.add(key, courses)
+                self.hashes[key] = hashes[key]
+                updated += 1
+            self.version = version
+            return updated
+
+    def add(self, key, courses):
+        """
+        Indexes the meeting times of a term.
+
+        Args:
+            key (string):   The cache key of the term.
+            courses (list): A list of Course.
+        """
+        account, term = app.split_key(key)
+        bookings = []
+        busy = 0
+        for course in courses:
+            for times in course.meetings:
+                if times.begin is None or times.end is None:
+                    continue
+                booking = Booking(key, account, term, course, times)
+                bookings.append(booking)
+                for day in range(len(DAYS)):
+                    if times.days & 1 << day:
+                        busy |= minute_mask(day, times.begin, times.end)
+                for bucket in buckets_of(times):
+                    self.buckets[bucket].add(booking)
+        self.bookings[key] = bookings
+        self.busy[key] = busy
+
+    def remove(self, key):
+        """
+        Drops a term from the index.
+        """
+        bookings = self.bookings.pop(key, [])
+        self.busy.pop(key, None)
+        self.hashes.pop(key, None)
+        for booking in bookings:
+            for bucket in buckets_of(booking.times):
+                self.buckets[bucket].discard(booking)
+
+    def at(self, day, minute, on=None):
+        """
+        Finds the courses in session at a time of the week.
+
+        Args:
+            day (int):      The day of the week, 0 is Monday.
+            minute (int):   Minutes after midnight.
+            on (date):      Optional date, to leave out courses that have
+                            not started or already ended.
+
+        Returns:
+            A list of Booking, sorted by cache key and CRN.
+        """
+        bucket = (day * MINUTES + minute) // BUCKET
+        return sorted((booking for booking in list(self.buckets[bucket])
+            if booking.times.days & 1 << day and
+            booking.times.begin <= minute < booking.times.end and
+            (on is None or (not booking.times.start_date or
+                booking.times.start_date <= on) and
+                (not booking.times.end_date or on <= booking.times.end_date))),
+            key=lambda booking: (booking.key, booking.course.crn))
+
+    def is_busy(self, key, day, begin, end):
+        """
+        Checks if a term has a course during a stretch of a day.
+
+        Args:
+            key (string):   The cache key of the term.
+            day (int):      The day of the week, 0 is Monday.
+            begin, end (int):   Minutes after midnight.
+        """
+        return bool(self.busy.get(key, 0) & minute_mask(day, begin, end))
+
+    def conflicts(self, key):
+        """
+        Finds the courses of a term that meet at the same time.
+
+        Returns:
+            A list of (Booking, Booking) pairs.
+        """
+        bookings = self.bookings.get(key, [])
+        return [(a, b) for i, a in enumerate(bookings)
+                for b in bookings[i + 1:] if overlap(a.times, b.times)]
+
+    def free(self, key, day, start=DAY_START, end=DAY_END, minimum=30):
+        """
+        Finds the free time of a term on a day of the week.
+
+        Args:
+            key (string):   The cache key of the term.
+            day (int):      The day of the week, 0 is Monday.
+            start, end (int):   The part of the day to look at, in minutes
+                                after midnight.
+            minimum (int):  Shortest gap worth returning, in minutes.
+
+        Returns:
+            A list of (begin, end) tuples in minutes after midnight.
+        """
+        busy = sorted((b.times.begin, b.times.end) for b in
+                self.bookings.get(key, []) if b.times.days & 1 << day)
+        gaps = []
+        for begin, finish in busy + [(end, end)]:
+            begin = min(begin, end)
+            if begin - start >= minimum:
+                gaps.append((start, begin))
+            start = max(start, finish)
+            if start >= end:
+                break
+        return gaps
+
+_timetable = None
+
+def get_timetable():
+    """
+    Gets this process's timetable, refreshed from the cache.
+    """
+    global _timetable
+    if _timetable is None:
+        _timetable = Timetable()
+    _timetable.refresh()
+    return _timetable
+
+def format_minutes(minutes):
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
+
+def main():
+    quarter, year = app.get_user_input()
+    term = '_{}{}'.format(year, quarter)
+    timetable = get_timetable()
+    keys = [key for key in sorted(timetable.bookings)
+            if app.split_key(key)[1] == term]
+    if not keys:
+        print('Nothing cached for {} {}, run ./warm.py first.'.format(
+            quarter, year))
+        return
+
+    for key in keys:
+        account = app.split_key(key)[0] or app.current_account()
+        print('\n{} {} {}'.format(account, quarter, year))
+        for a, b in timetable.conflicts(key):
+            print('Conflict: {} {} and {} {}'.format(a.course.subject,
+                a.course.number, b.course.subject, b.course.number))
+        for day, (name, code) in enumerate(DAYS[:5]):
+            print('{}: free {}'.format(name.title(), ', '.join(
+                '{}-{}'.format(format_minutes(begin), format_minutes(end))
+                for begin, end in timetable.free(key, day)) or 'never'))
+
+if __name__ == "__main__":
+    if not app.SILENT:
+        app.print_greeting(app_name, version)
+    try:
+        main()
+    except KeyboardInterrupt:
+        print('\nBye Felicia!')
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+    tracing.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Lightweight timing spans for network calls and storage operations.
+
+    With --trace or --profile every span is written as a JSON line to
+    .logs/trace.jsonl. --profile also prints the call count and p50/p95 of
+    each operation at exit, and --profile [file] writes a cProfile dump too.
+    Percentiles are taken over the last SAMPLES spans of each operation, so
+    memory stays flat in processes that run for days.
+"""
+import anti_banner as app
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+trace_file = 'trace.jsonl'
+FLUSH_EVERY = 100
+# durations kept per operation for the percentiles
+SAMPLES = 1000
+
+_lock = threading.Lock()
+_buffer = []
+# op : [calls, total ms, the last SAMPLES durations]
+_durations = {}
+_profiler = None
+
+def enabled():
+    return app.args['trace'] or app.args['profile'] is not None
+
+@contextmanager
+def span(op, **attrs):
+    """
+    Times the body of a with block as one operation.
+
+    Args:
+        op (string):    The operation name, i.e. 'http.GET auth.ucr.edu'.
+        attrs:          Extra fields to write with the span.
+
+    Examples:
+        >>> with span('cache.read', key='_2017Spring'):
+        ...     data = cache[key]
+    """
+    if not enabled():
+        yield
+        return
+
+    start = time.time()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        ms = (time.time() - start) * 1000
+        attrs.update({ 'op' : op, 'ts' : round(start, 3), 'ms' : round(ms, 3),
+            'thread' : threading.current_thread().name })
+        if error:
+            attrs['error'] = error
+        with _lock:
+            stats = _durations.setdefault(op, [0, 0, deque(maxlen=SAMPLES)])
+            stats[0] += 1
+            stats[1] += ms
+            stats[2].append(ms)
+            _buffer.append(json.dumps(attrs, sort_keys=True))
+            if len(_buffer) >= FLUSH_EVERY:
+                flush()
+
+def flush():
+    """
+    Appends buffered spans to the trace file. Callers hold _lock.
+    """
+    if _buffer:
+        with open(os.path.join(app.LOG_DIR, trace_file), 'a') as trace:
+            trace.write('\n'.join(_buffer) + '\n')
+        del _buffer[:]
+
+def percentile(samples, p):
+    """
+    Gets the p-th percentile of a sorted list of samples (nearest rank).
+    """
+    return samples[min(len(samples) - 1, int(round(p / 100.0 *
+        (len(samples) - 1))))]
+
+def summary():
+    """
+    Summarizes the spans of this run.
+
+    Returns:
+        A list of (op, count, p50 ms, p95 ms, total ms), slowest total first.
+    """
+    rows = []
+    with _lock:
+        for op, (calls, total, recent) in _durations.items():
+            recent = sorted(recent)
+            rows.append((op, calls, percentile(recent, 50),
+                percentile(recent, 95), total))
+    return sorted(rows, key=lambda row: -row[4])
+
+def print_summary(out=sys.stderr):
+    """
+    Prints the --profile report.
+    """
+    out.write('\n{:>6} {:>10} {:>10} {:>10}  {}\n'.format('calls', 'p50 ms', 
+        'p95 ms', 'total ms', 'operation'))
+    for op, calls, p50, p95, total in summary():
+        out.write('{:>6} {:>10.1f} {:>10.1f} {:>10.1f}  {}\n'.format(calls, 
+            p50, p95, total, op))
+
+def finish():
+    """
+    Flushes spans and prints the profile report, runs at exit.
+    """
+    with _lock:
+        flush()
+    if app.args['profile'] is not None:
+        if _profiler:
+            _profiler.disable()
+            _profiler.dump_stats(app.args['profile'] if
+                    os.path.isabs(app.args['profile']) else
+                    os.path.join(app.LOG_DIR, app.args['profile']))
+        print_summary()
+
+if enabled():
+    if app.args['profile']:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(finish)
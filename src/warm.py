@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+    warm.py
+    Author: Joel Gomez
+    Date created: 2026/10/19
+    Python Version 3.5.2
+
+    Anti-Banner Cache Warmer - Prefetches the registration data of the
+    current and upcoming quarters for every configured account, so
+    interactive runs with --cached and the first banner_changes poll of a
+    term are cache hits.
+
+    Meant to be scheduled off-peak, i.e. `0 4 * * * ./warm.py --silent`.
+    Set "warm_hours" in credentials.json, i.e. [2, 6], to make runs outside
+    of those hours do nothing. -q and -y warm one quarter instead.
+"""
+import anti_banner as app
+import logs
+import time
+from banner_connect import get_schedule
+from concurrent.futures import ThreadPoolExecutor
+
+app_name = 'Cache Warmer'
+version = '1.0'
+# accounts fetched at the same time
+WORKERS = 4
+
+def warm_terms():
+    """
+    Gets the quarters to prefetch.
+
+    Returns:
+        A list of (quarter, year) tuples.
+    """
+    if app.args['q'] or app.args['y']:
+        return [app.get_user_input()]
+    current = app.current_term()
+    return [current, app.next_term(*current)]
+
+def off_peak(hour=None):
+    """
+    Checks if now is inside the configured "warm_hours".
+
+    Args:
+        hour (int): The hour to check, defaults to the current one.
+
+    Returns:
+        True if no hours are configured or the hour is inside them.
+    """
+    hours = app.get_config('warm_hours')
+    if not hours:
+        return True
+    hour = time.localtime().tm_hour if hour is None else hour
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    # i.e. [22, 4] wraps around midnight
+    return hour >= start or hour < end
+
+def warm_account(login, terms):
+    """
+    Fetches the given quarters for one account into the cache.
+
+    Args:
+        login (tuple):  (netID, password), or None for the default account.
+        terms (list):   (quarter, year) tuples.
+
+    Returns:
+        A list of (account, quarter, year, error) tuples, error is None for
+        terms that were cached.
+    """
+    account = login[0] if login else app.current_account()
+    results = []
+    for quarter, year in terms:
+        try:
+            get_schedule(quarter, year, login=login)
+            results.append((account, quarter, year, None))
+        except app.BannerError as e:
+            logs.log_event('errors', 'Warm up failed', logs.logging.ERROR,
+                    error=str(e), account=account,
+                    term='_{}{}'.format(year, quarter))
+            results.append((account, quarter, year, str(e)))
+    return results
+
+def main():
+    """
+    Prefetches every configured account's current and upcoming quarters.
+    """
+
+    if not app.SILENT:
+        app.print_greeting(app_name, version)
+    if not off_peak():
+        if not app.SILENT:
+            print('Outside of warm_hours, nothing to do.')
+        return
+
+    terms = warm_terms()
+    accounts = app.get_accounts()
+    if None in accounts:
+        # prompt for the default login before the workers start
+        app.get_login()
+
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            for results in pool.map(lambda login: warm_account(login, terms),
+                    accounts):
+                for account, quarter, year, error in results:
+                    failed += error is not None
+                    if not app.SILENT:
+                        print('{:<12} {} {:<6}  {}'.format(account, year,
+                            quarter, error or 'cached'))
+    except KeyboardInterrupt:
+        print('\nBye Felicia!')
+        quit()
+
+    if failed:
+        exit(1)
+
+if __name__ == "__main__":
+    main()